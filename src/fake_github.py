@@ -0,0 +1,604 @@
+#!/usr/bin/env python
+# encoding: utf-8
+'''
+fake_github -- Local stand in for the GitHub REST API endpoints used by github_files
+
+Serves synthetic repositories so github_files can be exercised and
+benchmarked without network access or credentials.
+Real git object hashing is used for blobs and trees so that local
+blob sha comparisons behave as they do against GitHub.
+'''
+
+import sys
+import json
+import time
+import random
+import base64
+import hashlib
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote, quote
+from optparse import OptionParser
+
+
+"""
+git blob sha of bytes
+"""
+def blobSha(data):
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def dateStr(date):
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+"""
+One synthetic repository
+Objects are kept as git would: blobs by sha, trees by sha
+(list of (name, mode, type, sha)), commits by sha
+"""
+class FakeRepo:
+    def __init__(self, owner="tester", name="Synthetic", default_branch="master"):
+        self.owner = owner
+        self.name = name
+        self.default_branch = default_branch
+        self.blobs = {}                     # sha : bytes
+        self.trees = {}                     # sha : [(name, mode, type, sha),...]
+        self.commits = {}                   # sha : commit dict
+        self.refs = {}                      # branch : commit sha
+        self.comments = {}                  # commit sha : [comment,...]
+        self.lock = threading.Lock()
+
+    def addBlob(self, data):
+        sha = blobSha(data)
+        self.blobs[sha] = data
+        return sha
+
+    """
+    Build nested trees from {path : (mode, type, sha)}
+    Returns root tree sha
+    """
+    def addTree(self, path_map):
+        dirs = {}
+        for path, ent in path_map.items():
+            parts = path.split("/")
+            dirs.setdefault(parts[0], {})
+            if len(parts) == 1:
+                dirs[parts[0]] = ent
+            else:
+                if not isinstance(dirs[parts[0]], dict):
+                    dirs[parts[0]] = {}
+                dirs[parts[0]]["/".join(parts[1:])] = ent
+        entries = []
+        for name, ent in dirs.items():
+            if isinstance(ent, dict):
+                entries.append((name, "040000", "tree", self.addTree(ent)))
+            else:
+                mode, typ, sha = ent
+                entries.append((name, mode, typ, sha))
+        entries.sort(key=lambda e: e[0] + "/" if e[2] == "tree" else e[0])
+        body = b"".join(b"%s %s\0" % (e[1].lstrip("0").encode(), e[0].encode())
+                        + bytes.fromhex(e[3]) for e in entries)
+        sha = hashlib.sha1(b"tree %d\0" % len(body) + body).hexdigest()
+        self.trees[sha] = entries
+        return sha
+
+    """
+    Flatten tree to {path : (mode, type, sha)}
+    """
+    def flatTree(self, tree_sha, prefix=""):
+        path_map = {}
+        for name, mode, typ, sha in self.trees[tree_sha]:
+            path = prefix + name
+            if typ == "tree":
+                path_map.update(self.flatTree(sha, path + "/"))
+            else:
+                path_map[path] = (mode, typ, sha)
+        return path_map
+
+    """
+    Create commit of tree on parents, recording the changed files
+    """
+    def addCommit(self, tree_sha, parents, message, date=None, renames=None):
+        if date is None:
+            date = datetime.datetime.utcnow()
+        new_map = self.flatTree(tree_sha)
+        old_map = {}
+        if parents:
+            old_map = self.flatTree(self.commits[parents[0]]["tree"])
+        renames = renames if renames else {}
+        renamed_from = set(renames.values())
+        files = []
+        for path in sorted(set(new_map) | set(old_map)):
+            new = new_map.get(path)
+            old = old_map.get(path)
+            if new == old:
+                continue
+            if path in renamed_from and new is None:
+                continue
+            ent = dict(filename=path, sha=new[2] if new else old[2],
+                        additions=1, deletions=0, changes=1)
+            if path in renames:
+                ent["status"] = "renamed"
+                ent["previous_filename"] = renames[path]
+            elif old is None:
+                ent["status"] = "added"
+            elif new is None:
+                ent["status"] = "removed"
+            else:
+                ent["status"] = "modified"
+            files.append(ent)
+        person = dict(name="Tester", email="tester@example.com", date=dateStr(date))
+        text = "tree %s\n%s%s" % (tree_sha, "".join("parent %s\n" % p for p in parents), message)
+        sha = hashlib.sha1(b"commit %d\0" % len(text) + text.encode()).hexdigest()
+        self.commits[sha] = dict(sha=sha, tree=tree_sha, parents=list(parents),
+                                message=message, author=person, committer=person,
+                                date=date, files=files)
+        return sha
+
+    """
+    First parent history, newest first
+    """
+    def history(self, head_sha):
+        sha = head_sha
+        while sha:
+            commit = self.commits[sha]
+            yield commit
+            sha = commit["parents"][0] if commit["parents"] else None
+
+
+"""
+Generate a synthetic repository
+nFile files spread over nDir directories, nCommit commits of history,
+each later commit touching a few files, with occasional renames and deletes
+"""
+def makeRepo(nFile=100, nCommit=50, nDir=10, fileSize=1000, seed=1,
+             name="Synthetic", owner="tester", branch="master"):
+    rnd = random.Random(seed)
+    repo = FakeRepo(owner=owner, name=name, default_branch=branch)
+    def content(path, gen):
+        head = ("%s %d\n" % (path, gen)).encode()
+        return head + bytes(rnd.randrange(32, 127) for i in range(max(fileSize - len(head), 0)))
+    paths = {}
+    for i in range(nFile):
+        path = "dir%d/file%d.txt" % (i % max(nDir, 1), i) if nDir > 0 else "file%d.txt" % i
+        paths[path] = ("100644", "blob", repo.addBlob(content(path, 0)))
+    date = datetime.datetime(2018, 3, 1)
+    head = repo.addCommit(repo.addTree(paths), [], "Initial commit", date=date)
+    for gen in range(1, nCommit):
+        date += datetime.timedelta(hours=1)
+        renames = {}
+        for i in range(rnd.randint(1, 5)):
+            path = rnd.choice(sorted(paths))
+            roll = rnd.random()
+            if roll < .05 and len(paths) > 1:
+                del paths[path]                 # Delete
+            elif roll < .1:
+                new_path = path.replace(".txt", "_r%d.txt" % gen)
+                paths[new_path] = paths.pop(path)
+                renames[new_path] = path
+            else:
+                paths[path] = ("100644", "blob", repo.addBlob(content(path, gen)))
+        head = repo.addCommit(repo.addTree(paths), [head], "Commit %d" % gen,
+                              date=date, renames=renames)
+    repo.refs[branch] = head
+    return repo
+
+
+"""
+Request handler
+Implements: user, repos, branches, contents, commits (paged), commit comments,
+git trees/blobs/commits/refs
+"""
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose > 1:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self.handle_verb("GET")
+
+    def do_POST(self):
+        self.handle_verb("POST")
+
+    def do_PATCH(self):
+        self.handle_verb("PATCH")
+
+    def handle_verb(self, verb):
+        server = self.server
+        url = urlparse(self.path)
+        self.query = {k : v[-1] for k, v in parse_qs(url.query).items()}
+        self.body = None
+        length = int(self.headers.get("Content-Length", 0))
+        if length > 0:
+            self.body = json.loads(self.rfile.read(length))
+        if server.latency > 0:
+            time.sleep(server.latency)
+        with server.lock:
+            server.nRequest += 1
+            endpoint = verb + " " + endpointName(url.path)
+            server.endpoints[endpoint] = server.endpoints.get(endpoint, 0) + 1
+            reset = server.windowStart + server.rateWindow
+            now = time.time()
+            if now >= reset:
+                server.windowStart = now
+                server.remaining = server.rateLimit
+                reset = now + server.rateWindow
+            server.remaining -= 1
+            remaining = server.remaining
+            self.rate_headers = {"X-RateLimit-Limit" : str(server.rateLimit),
+                                 "X-RateLimit-Remaining" : str(max(remaining, 0)),
+                                 "X-RateLimit-Reset" : str(int(reset))}
+        if remaining < 0:
+            return self.reply(403, dict(message="API rate limit exceeded for tester."))
+        if server.rnd.random() < server.secondaryRate:
+            return self.reply(403, dict(message="You have exceeded a secondary rate limit. Please wait a few minutes before you try again."),
+                              headers={"Retry-After" : "1"})
+        if server.rnd.random() < server.errorRate:
+            return self.reply(502, dict(message="Server Error"))
+        try:
+            route(self, verb, unquote(url.path))
+        except KeyError as e:
+            self.reply(404, dict(message="Not Found", detail=str(e)))
+
+    def reply(self, status, data=None, headers=None, raw=None):
+        if raw is not None:
+            body = raw
+            ctype = "application/octet-stream"
+        else:
+            body = json.dumps(data).encode() if data is not None else b""
+            ctype = "application/json; charset=utf-8"
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            status = 304
+            body = b""
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        if status in (200, 304):
+            self.send_header("ETag", etag)
+        for name, value in self.rate_headers.items():
+            self.send_header(name, value)
+        if headers:
+            for name, value in headers.items():
+                self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.nByte += len(body)
+
+
+"""
+Endpoint name for statistics: path with ids replaced
+"""
+def endpointName(path):
+    parts = path.strip("/").split("/")
+    if len(parts) >= 3 and parts[0] == "repos":
+        parts[1:3] = ["{owner}", "{repo}"]
+        if len(parts) > 4 and parts[3] == "git":
+            return "/".join(parts[:5] + ["{sha}"][:len(parts) - 5])
+        if len(parts) > 4:
+            parts[4] = "{id}"
+        return "/".join(parts[:6])
+    return "/".join(parts)
+
+
+"""
+Dispatch one request to the repository model
+"""
+def route(handler, verb, path):
+    server = handler.server
+    base = server.baseUrl
+    parts = path.strip("/").split("/")
+    if parts == ["user"]:
+        return handler.reply(200, dict(login=server.owner, url=base + "/users/" + server.owner,
+                                       type="User"))
+    if parts == ["rate_limit"]:
+        core = dict(limit=server.rateLimit, remaining=max(server.remaining, 0),
+                    reset=int(server.windowStart + server.rateWindow))
+        return handler.reply(200, dict(resources=dict(core=core, search=core), rate=core))
+    if len(parts) < 3 or parts[0] != "repos":
+        raise KeyError(path)
+    repo = server.repos[parts[2]]
+    rest = parts[3:]
+    repo_url = "%s/repos/%s/%s" % (base, repo.owner, repo.name)
+    with repo.lock:
+        if rest == []:
+            return handler.reply(200, repoJson(repo, repo_url))
+        if rest[0] == "branches":
+            if len(rest) == 1:
+                page, per_page = pageArgs(handler)
+                names = sorted(repo.refs)
+                items = [dict(name=n, commit=dict(sha=repo.refs[n], url=repo_url + "/commits/" + repo.refs[n]))
+                         for n in names[(page - 1)*per_page:page*per_page]]
+                return handler.reply(200, items, headers=linkHeader(handler, repo_url + "/branches", page, per_page, len(names)))
+            name = "/".join(rest[1:])
+            sha = repo.refs[name]
+            return handler.reply(200, dict(name=name, commit=commitJson(repo, repo_url, repo.commits[sha], files=False),
+                                           protected=False))
+        if rest[0] == "commits":
+            if len(rest) == 1:
+                return listCommits(handler, repo, repo_url)
+            commit = repo.commits[findCommit(repo, rest[1])]
+            if len(rest) == 3 and rest[2] == "comments":
+                page, per_page = pageArgs(handler)
+                comments = repo.comments.get(commit["sha"], [])
+                return handler.reply(200, comments[(page - 1)*per_page:page*per_page],
+                                     headers=linkHeader(handler, repo_url + "/commits/%s/comments" % commit["sha"],
+                                                        page, per_page, len(comments)))
+            return handler.reply(200, commitJson(repo, repo_url, commit, files=True))
+        if rest[0] == "contents":
+            return contents(handler, repo, repo_url, "/".join(rest[1:]))
+        if rest[0] == "git":
+            return gitObjects(handler, verb, repo, repo_url, rest[1:])
+    raise KeyError(path)
+
+
+def repoJson(repo, repo_url):
+    return dict(name=repo.name, full_name="%s/%s" % (repo.owner, repo.name),
+                owner=dict(login=repo.owner), url=repo_url, default_branch=repo.default_branch,
+                private=False, size=sum(len(b) for b in repo.blobs.values()) // 1024,
+                git_url="git://fake/%s/%s.git" % (repo.owner, repo.name),
+                branches_url=repo_url + "/branches{/branch}",
+                contents_url=repo_url + "/contents/{+path}",
+                trees_url=repo_url + "/git/trees{/sha}")
+
+
+def pageArgs(handler):
+    return int(handler.query.get("page", 1)), int(handler.query.get("per_page", 30))
+
+
+def linkHeader(handler, url, page, per_page, total):
+    last = max((total + per_page - 1) // per_page, 1)
+    links = []
+    args = dict(handler.query)
+    args["per_page"] = str(per_page)
+    args.pop("page", None)
+    def pageUrl(n):                         # page last, as GitHub
+        return url + "?" + "&".join("%s=%s" % (k, v) for k, v in sorted(args.items())) + "&page=%d" % n
+    if page < last:
+        links.append('<%s>; rel="next"' % pageUrl(page + 1))
+        links.append('<%s>; rel="last"' % pageUrl(last))
+    if page > 1:
+        links.append('<%s>; rel="first"' % pageUrl(1))
+        links.append('<%s>; rel="prev"' % pageUrl(page - 1))
+    if not links:
+        return {}
+    return {"Link" : ", ".join(links)}
+
+
+"""
+Commit sha from sha or branch name
+"""
+def findCommit(repo, ref):
+    if ref in repo.refs:
+        return repo.refs[ref]
+    if ref in repo.commits:
+        return ref
+    for sha in repo.commits:
+        if sha.startswith(ref):
+            return sha
+    raise KeyError(ref)
+
+
+def commitJson(repo, repo_url, commit, files=False):
+    sha = commit["sha"]
+    git_commit = dict(sha=sha, url=repo_url + "/git/commits/" + sha, message=commit["message"],
+                      author=commit["author"], committer=commit["committer"],
+                      tree=dict(sha=commit["tree"], url=repo_url + "/git/trees/" + commit["tree"]),
+                      comment_count=len(repo.comments.get(sha, [])))
+    data = dict(sha=sha, url=repo_url + "/commits/" + sha, commit=git_commit,
+                comments_url=repo_url + "/commits/%s/comments" % sha,
+                author=None, committer=None,
+                parents=[dict(sha=p, url=repo_url + "/commits/" + p) for p in commit["parents"]])
+    if files:
+        data["files"] = [dict(f, contents_url="%s/contents/%s?ref=%s" % (repo_url, quote(f["filename"]), sha),
+                              raw_url="%s/raw/%s/%s" % (repo_url, sha, quote(f["filename"])),
+                              blob_url="%s/blob/%s/%s" % (repo_url, sha, quote(f["filename"])))
+                         for f in commit["files"]]
+    return data
+
+
+def listCommits(handler, repo, repo_url):
+    query = handler.query
+    head = findCommit(repo, query.get("sha", repo.default_branch))
+    since = query.get("since")
+    until = query.get("until")
+    path = query.get("path")
+    selected = []
+    for commit in repo.history(head):
+        date = dateStr(commit["date"])
+        if since and date < since:
+            break
+        if until and date > until:
+            continue
+        if path:
+            touched = False
+            for f in commit["files"]:
+                if f["filename"] == path or f["filename"].startswith(path + "/"):
+                    touched = True
+            if not touched:
+                continue
+        selected.append(commit)
+    page, per_page = pageArgs(handler)
+    items = [commitJson(repo, repo_url, c) for c in selected[(page - 1)*per_page:page*per_page]]
+    handler.reply(200, items, headers=linkHeader(handler, repo_url + "/commits", page, per_page, len(selected)))
+
+
+def contents(handler, repo, repo_url, path):
+    ref = handler.query.get("ref", repo.default_branch)
+    commit = repo.commits[findCommit(repo, ref)]
+    tree_sha = commit["tree"]
+    ent = ("040000", "tree", tree_sha)
+    if path != "":
+        for name in path.split("/"):
+            match = [e for e in repo.trees[ent[2]] if e[0] == name] if ent[1] == "tree" else []
+            if not match:
+                raise KeyError(path)
+            ent = match[0][1:]
+    def item(name, item_path, mode, typ, sha):
+        size = len(repo.blobs[sha]) if typ == "blob" else 0
+        return dict(name=name, path=item_path, sha=sha, size=size,
+                    type="dir" if typ == "tree" else "file",
+                    url="%s/contents/%s?ref=%s" % (repo_url, item_path, ref),
+                    git_url="%s/git/%ss/%s" % (repo_url, typ, sha))
+    if ent[1] == "tree":
+        prefix = path + "/" if path else ""
+        return handler.reply(200, [item(e[0], prefix + e[0], *e[1:]) for e in repo.trees[ent[2]]])
+    data = item(path.split("/")[-1], path, *ent)
+    data["encoding"] = "base64"
+    data["content"] = base64.b64encode(repo.blobs[ent[2]]).decode()
+    handler.reply(200, data)
+
+
+def gitObjects(handler, verb, repo, repo_url, rest):
+    kind = rest[0]
+    body = handler.body
+    if kind == "trees" and verb == "GET":
+        tree_sha = rest[1]
+        if tree_sha not in repo.trees:
+            tree_sha = repo.commits[findCommit(repo, tree_sha)]["tree"]
+        recursive = handler.query.get("recursive") not in (None, "0", "false")
+        items = []
+        def addItems(sha, prefix):
+            for name, mode, typ, esha in repo.trees[sha]:
+                ent = dict(path=prefix + name, mode=mode, type=typ, sha=esha,
+                           url="%s/git/%ss/%s" % (repo_url, typ, esha))
+                if typ == "blob":
+                    ent["size"] = len(repo.blobs[esha])
+                items.append(ent)
+                if typ == "tree" and recursive:
+                    addItems(esha, prefix + name + "/")
+        addItems(tree_sha, "")
+        truncated = False
+        limit = handler.server.treeLimit
+        if recursive and limit and len(items) > limit:
+            items = items[:limit]
+            truncated = True
+        return handler.reply(200, dict(sha=tree_sha, url=repo_url + "/git/trees/" + tree_sha,
+                                       tree=items, truncated=truncated))
+    if kind == "trees" and verb == "POST":
+        path_map = {}
+        if body.get("base_tree"):
+            path_map = repo.flatTree(body["base_tree"])
+        for ent in body["tree"]:
+            if ent.get("sha", "") is None:
+                path_map.pop(ent["path"], None)
+                continue
+            sha = ent.get("sha")
+            if "content" in ent:
+                sha = repo.addBlob(ent["content"].encode())
+            path_map[ent["path"]] = (ent["mode"], ent["type"], sha)
+        sha = repo.addTree(path_map)
+        return handler.reply(201, dict(sha=sha, url=repo_url + "/git/trees/" + sha, tree=[]))
+    if kind == "blobs" and verb == "POST":
+        content = body["content"]
+        if body.get("encoding") == "base64":
+            data = base64.b64decode(content)
+        else:
+            data = content.encode()
+        sha = repo.addBlob(data)
+        return handler.reply(201, dict(sha=sha, url=repo_url + "/git/blobs/" + sha))
+    if kind == "blobs" and verb == "GET":
+        data = repo.blobs[rest[1]]
+        if "raw" in handler.headers.get("Accept", ""):
+            return handler.reply(200, raw=data)
+        return handler.reply(200, dict(sha=rest[1], size=len(data), encoding="base64",
+                                       content=base64.b64encode(data).decode(),
+                                       url=repo_url + "/git/blobs/" + rest[1]))
+    if kind == "commits" and verb == "POST":
+        sha = repo.addCommit(body["tree"], body.get("parents", []), body["message"])
+        return handler.reply(201, gitCommitJson(repo, repo_url, repo.commits[sha]))
+    if kind == "commits" and verb == "GET":
+        return handler.reply(200, gitCommitJson(repo, repo_url, repo.commits[findCommit(repo, rest[1])]))
+    if kind == "refs" or kind == "ref":
+        name = "/".join(rest[1:])
+        if not name.startswith("heads/"):
+            raise KeyError(name)
+        branch = name[len("heads/"):]
+        if verb == "PATCH":
+            repo.refs[branch] = body["sha"]
+        sha = repo.refs[branch]
+        return handler.reply(200, dict(ref="refs/" + name, url=repo_url + "/git/refs/" + name,
+                                       object=dict(sha=sha, type="commit", url=repo_url + "/git/commits/" + sha)))
+    raise KeyError("/".join(rest))
+
+
+def gitCommitJson(repo, repo_url, commit):
+    return dict(sha=commit["sha"], url=repo_url + "/git/commits/" + commit["sha"],
+                message=commit["message"], author=commit["author"], committer=commit["committer"],
+                tree=dict(sha=commit["tree"], url=repo_url + "/git/trees/" + commit["tree"]),
+                parents=[dict(sha=p, url=repo_url + "/git/commits/" + p) for p in commit["parents"]])
+
+
+"""
+The fake server
+repos: list of FakeRepo, all owned by owner
+latency: seconds added to every request
+rateLimit, rateWindow: primary rate limit budget per window (seconds)
+secondaryRate, errorRate: probability of a secondary rate limit 403, or a 502
+treeLimit: recursive tree responses larger than this are truncated
+"""
+class FakeGitHub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, repos, port=0, owner="tester", latency=0.0, rateLimit=5000,
+                 rateWindow=3600, secondaryRate=0.0, errorRate=0.0, treeLimit=None,
+                 seed=1, verbose=0):
+        ThreadingHTTPServer.__init__(self, ("127.0.0.1", port), FakeGitHubHandler)
+        self.repos = {repo.name : repo for repo in repos}
+        self.owner = owner
+        self.latency = latency
+        self.rateLimit = rateLimit
+        self.rateWindow = rateWindow
+        self.remaining = rateLimit
+        self.windowStart = time.time()
+        self.secondaryRate = secondaryRate
+        self.errorRate = errorRate
+        self.treeLimit = treeLimit
+        self.rnd = random.Random(seed)
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.nRequest = 0
+        self.nByte = 0
+        self.endpoints = {}                 # "VERB endpoint" : count
+        self.baseUrl = "http://127.0.0.1:%d" % self.server_address[1]
+        self.thread = None
+
+    """
+    Serve in a background thread, returning base url
+    """
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.baseUrl
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = OptionParser(description="Serve a synthetic repository as a fake GitHub API")
+    parser.add_option("--port", dest="port", type="int", default=8000, help="port [default: %default]")
+    parser.add_option("--files", dest="nFile", type="int", default=100, help="files [default: %default]")
+    parser.add_option("--commits", dest="nCommit", type="int", default=50, help="commits [default: %default]")
+    parser.add_option("--dirs", dest="nDir", type="int", default=10, help="directories [default: %default]")
+    parser.add_option("--latency", dest="latency", type="float", default=0.0, help="seconds per request [default: %default]")
+    parser.add_option("-r", "--repo", dest="repo", default="Synthetic", help="repository name [default: %default]")
+    parser.add_option("-v", "--verbose", dest="verbose", action="count", default=0, help="set verbosity level")
+    (opts, args) = parser.parse_args(argv)
+    repo = makeRepo(nFile=opts.nFile, nCommit=opts.nCommit, nDir=opts.nDir, name=opts.repo)
+    server = FakeGitHub([repo], port=opts.port, latency=opts.latency, verbose=opts.verbose)
+    print("Serving %s at %s" % (opts.repo, server.baseUrl))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,12 +16,25 @@ github_files -- List / Investigate GitHub repositiory files
 import sys
 import os
 import datetime
+import hashlib
+import time
+import re
+import json
+import random
+import bisect
+import sqlite3
+import threading
+import queue
+import tempfile
+import select
+import struct
+import copy
+import csv
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
 from datetime import timezone
-from github import Github
-from github import InputGitTreeElement
 from getpass import getpass
 from optparse import OptionParser
-import path
 import traceback
 
 __all__ = []
@@ -31,65 +44,1009 @@ __updated__ = '2018-03-27'
 
 DEBUG = 0
 
+"""
+PyGithub (github) is imported where first needed, not here: it is most
+of the startup time, and --help, --offline and local only work never
+use it
+"""
+
 
 """
 Simple tool to facilitate easy object description
+PyGithub objects are described only from the data already fetched
+(_rawData), never through their attributes, which would complete
+the object with another API request.  Nested objects are shown by
+their identity (login, name, sha or url).
+If obj_desc.jsonOut is set, to an open file, descs also writes
+a JSON line: {"type": class name, "prefix": prefix, att: value, ...}
 """
             
 
 class obj_desc:
+    jsonOut = None                          # File for JSON lines, None - none
+    jsonLock = threading.Lock()
+    NOT_FETCHED = "(not fetched)"
+    
     def __init__(self, obj, *args):
         self.obj = obj
         self.prefix = None
         if len(args) >= 1:
             self.prefix = args[0]
+        self.className = obj.__class__.__name__
          
+    """
+    Value of attribute, without any request, NOT_FETCHED if not present
+    """
+    def value(self, att):
+        raw_data = getattr(self.obj, "_rawData", None)
+        if raw_data is None:
+            if not hasattr(self.obj, att):
+                return self.NOT_FETCHED
+            return getattr(self.obj, att)
+        if att not in raw_data:
+            return self.NOT_FETCHED
+        return self.short(raw_data[att])
+
+    def short(self, value):
+        if isinstance(value, dict):
+            for key in ("login", "name", "sha", "url"):
+                if key in value:
+                    return value[key]
+        return value
       
     def desc(self, att):
-        class_str = self.obj.__str__()
-        class_name = class_str.split("(")[0]
-        prefix = ""
-        descr = ""
-        att_val = "none"
-        if hasattr(self.obj,att):
-            attfun = getattr(self.obj, att)
-            att_val = attfun
-            descr = "%s.%s: %s" % (class_name, att, att_val)
-            if self.prefix != None and self.prefix != "":
-                prefix = self.prefix + ": "
-        print(prefix + descr)  
+        self.descs(att)
     
     def descs(self, *atts):
+        prefix = ""
+        if self.prefix != None and self.prefix != "":
+            prefix = self.prefix + ": "
         for att in atts:
-            self.desc(att)
+            print("%s%s.%s: %s" % (prefix, self.className, att, self.value(att)))
+        if obj_desc.jsonOut is not None:
+            record = dict(type=self.className)
+            if self.prefix:
+                record["prefix"] = self.prefix
+            for att in atts:
+                record[att] = self.value(att)
+            line = json.dumps(record, default=str)
+            with obj_desc.jsonLock:
+                obj_desc.jsonOut.write(line + "\n")
+
+
+"""
+Run statistics, for --stats-json
+Per phase wall and CPU (whole process) seconds, per endpoint HTTP
+request counts, bytes received and latency histograms, cache counts
+and rate limit use.  Phases may be profiled, with cProfile or
+pyinstrument, one profile file per phase run in profileDir;
+only one phase is profiled at a time.
+"""
+class RunStats:
+    LATENCY_BUCKETS = (.01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)     # Upper bounds, seconds
+    
+    def __init__(self):
+        self.startTime = time.time()
+        self.lock = threading.Lock()
+        self.phases = {}                    # name : {count, wall, cpu}
+        self.endpoints = {}                 # name : {count, bytes, errors, seconds, max, histogram}
+        self.counts = {}                    # group : {name : count}
+        self.rateLimit = {}
+        self.profiler = None                # None, "cprofile" or "pyinstrument"
+        self.profileDir = None
+        self.profiling = False
+        self.nProfile = 0
+
+    def setProfiler(self, profiler, profileDir="."):
+        if profiler not in ("cprofile", "pyinstrument"):
+            raise Exception("profiler %s is not cprofile or pyinstrument" % profiler)
+        if profiler == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                raise Exception("pyinstrument is not installed")
+        self.profiler = profiler
+        self.profileDir = profileDir
+        os.makedirs(profileDir, exist_ok=True)
+
+    """
+    Context manager timing, and, if profiling, profiling the phase
+    with runStats.phase("list"):
+    """
+    def phase(self, name):
+        return StatsPhase(self, name)
+
+    def addPhase(self, name, wall, cpu):
+        with self.lock:
+            phase = self.phases.setdefault(name, dict(count=0, wall=0., cpu=0.))
+            phase["count"] += 1
+            phase["wall"] += wall
+            phase["cpu"] += cpu
+
+    def startProfile(self, name):
+        with self.lock:
+            if self.profiler is None or self.profiling:
+                return None
+            self.profiling = True
+            self.nProfile += 1
+            profile_file = os.path.join(self.profileDir, "%02d_%s" % (self.nProfile, name))
+        if self.profiler == "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler, profile_file
+        
+        import pyinstrument
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        return profiler, profile_file
+
+    def stopProfile(self, profile):
+        profiler, profile_file = profile
+        if self.profiler == "cprofile":
+            profiler.disable()
+            profiler.dump_stats(profile_file + ".prof")
+        else:
+            profiler.stop()
+            with open(profile_file + ".txt", "w") as fout:
+                fout.write(profiler.output_text())
+        with self.lock:
+            self.profiling = False
+
+    """
+    Record HTTP request to url taking seconds, nbyte bytes received
+    """
+    def addRequest(self, verb, url, status, nbyte, seconds):
+        name = "%s %s" % (verb, endpointName(url))
+        with self.lock:
+            endpoint = self.endpoints.get(name)
+            if endpoint is None:
+                endpoint = dict(count=0, bytes=0, errors=0, seconds=0., max=0.,
+                                histogram=[0]*(len(self.LATENCY_BUCKETS)+1))
+                self.endpoints[name] = endpoint
+            endpoint["count"] += 1
+            endpoint["bytes"] += nbyte
+            endpoint["seconds"] += seconds
+            endpoint["max"] = max(endpoint["max"], seconds)
+            if status is None or status >= 400:
+                endpoint["errors"] += 1
+            endpoint["histogram"][bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+
+    """
+    Add counts, e.g. cache hits, to group
+    """
+    def addCounts(self, group, **counts):
+        with self.lock:
+            group_counts = self.counts.setdefault(group, {})
+            for name, count in counts.items():
+                group_counts[name] = group_counts.get(name, 0) + count
+
+    def report(self):
+        endpoints = {}
+        for name, endpoint in sorted(self.endpoints.items()):
+            histogram = {}
+            for index, count in enumerate(endpoint["histogram"]):
+                if index < len(self.LATENCY_BUCKETS):
+                    histogram["<=%gms" % (self.LATENCY_BUCKETS[index]*1000)] = count
+                else:
+                    histogram[">%gms" % (self.LATENCY_BUCKETS[-1]*1000)] = count
+            endpoints[name] = dict(count=endpoint["count"], bytes=endpoint["bytes"],
+                                   errors=endpoint["errors"],
+                                   meanSeconds=endpoint["seconds"]/max(endpoint["count"], 1),
+                                   maxSeconds=endpoint["max"], latency=histogram)
+        return dict(version=__version__, started=datetime.datetime.fromtimestamp(self.startTime).isoformat(),
+                    seconds=time.time() - self.startTime,
+                    cpuSeconds=time.process_time(),
+                    phases=self.phases,
+                    http=dict(requests=sum(endpoint["count"] for endpoint in endpoints.values()),
+                              bytes=sum(endpoint["bytes"] for endpoint in endpoints.values()),
+                              endpoints=endpoints),
+                    counts=self.counts,
+                    rateLimit=self.rateLimit)
+
+    def writeJson(self, stats_file):
+        with open(stats_file, "w") as fout:
+            json.dump(self.report(), fout, indent=2)
+        print("Run statistics are in %s" % os.path.abspath(stats_file))
+
+
+class StatsPhase:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.profile = self.stats.startProfile(self.name)
+        self.startTime = time.time()
+        self.startCpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stats.addPhase(self.name, time.time() - self.startTime, time.process_time() - self.startCpu)
+        if self.profile is not None:
+            self.stats.stopProfile(self.profile)
+        return False
+
+
+"""
+API endpoint of url, with names, numbers and shas replaced by placeholders
+e.g. https://api.github.com/repos/me/proj/git/trees/3f4c...?recursive=1
+    ==> repos/{owner}/{repo}/git/trees/{sha}
+"""
+def endpointName(url):
+    path = url.split("?")[0]
+    if "://" in path:
+        path = path.split("://", 1)[1]
+        path = path[path.find("/"):] if "/" in path else ""
+    parts = [part for part in path.split("/") if part != ""]
+    if len(parts) >= 3 and parts[0] == "repos":
+        parts[1:3] = ["{owner}", "{repo}"]
+        if len(parts) > 4 and parts[3] == "contents":
+            parts[4:] = ["{path}"]
+        elif len(parts) > 5 and parts[3] == "git" and parts[4] == "refs":
+            parts[5:] = ["{ref}"]
+        elif len(parts) > 4 and parts[3] == "branches":
+            parts[4:] = ["{branch}"]
+    for index, part in enumerate(parts):
+        if re.fullmatch(r"[0-9a-f]{40}", part):
+            parts[index] = "{sha}"
+        elif part.isdigit():
+            parts[index] = "{id}"
+    return "/".join(parts)
+
+
+runStats = RunStats()                       # This run's statistics
+
+
+"""
+Report item kinds: kind : (text line, fields)
+Fields named ...Time are epoch seconds, shown in text as local date and time
+"""
+REPORT_KINDS = {
+    "remote" : ("%(path)s %(type)s %(size)d", ("path", "type", "size")),
+    "commit" : ("commit %(count)d: %(date)s %(committer)s %(message)s", ("count", "date", "committer", "message")),
+    "dated" : ("%(path)s %(source)s date: %(date)s   nDate: %(count)d of %(total)d",
+               ("path", "source", "date", "count", "total")),
+    "undated" : ("    %(path)s", ("path",)),
+    "new" : ("%(path)s not in repository ==> New", ("path",)),
+    "hashCompare" : ("%(path)s %(sha)s repo: %(repoSha)s", ("path", "sha", "repoSha")),
+    "differs" : ("%(path)s local content differs from repo", ("path",)),
+    "undatedDiffers" : ("%(path)s has no commit date, local content differs from repo", ("path",)),
+    "compare" : ("%(path)s %(localTime)s repo: '%(repoTime)s'", ("path", "localTime", "repoTime")),
+    "newer" : ("%(path)s local is newer %(localTime)s than repo %(repoTime)s", ("path", "localTime", "repoTime")),
+    "upload" : ("%(path)s %(how)s %(size)d bytes %(sha)s", ("path", "how", "size", "sha")),
+    "committed" : ("commit %(sha)s: %(count)d files changed on %(branch)s", ("sha", "count", "branch")),
+    "commitFile" : ("    %(path)s", ("path",)),
+    "message" : ("%(text)s", ("text",)),
+    }
+REPORT_SCAN_FIELDS = ("repo", "branch")    # Of every item in jsonl and csv, from Reporter.scan
+
+
+"""
+Report of scan results: remote files, dates, local changes and commits
+Items are kept as data, a kind and its fields, and formatted only when
+written, so items above the verbosity level cost just a comparison.
+To the console items are written, as text, when made, keeping their
+place among the progress lines; to a file (--out) they are written
+bufferItems at a time.
+format: text - the lines of REPORT_KINDS, jsonl - a JSON object per line,
+csv - a column per field
+Structured items also have the repository and branch being scanned,
+set per thread, so concurrent manifest scans can share one report.
+"""
+class Reporter:
+    FORMATS = ("text", "jsonl", "csv")
+    
+    def __init__(self, verbose=0, bufferItems=1000):
+        self.verbose = verbose
+        self.bufferItems = bufferItems
+        self.format = "text"
+        self.out = None                     # None - sys.stdout, as it is at the time
+        self.outFile = None
+        self.buffer = []                    # (kind, fields)
+        self.lock = threading.Lock()
+        self.local = threading.local()      # scan : fields added to this thread's items
+        self.columns = ["kind"] + list(REPORT_SCAN_FIELDS)
+        self.timeFields = {}                # kind : fields shown as local date and time
+        for kind, (text, fields) in REPORT_KINDS.items():
+            self.columns.extend(field for field in fields if field not in self.columns)
+            self.timeFields[kind] = [field for field in fields if field.endswith("Time")]
+        self.nItem = 0
+
+    """
+    Report to out_file, None - the console, in format
+    """
+    def open(self, out_file=None, format="text", verbose=0):
+        if format not in self.FORMATS:
+            raise Exception("Unknown report format %s - use %s" % (format, ", ".join(self.FORMATS)))
+        self.close()
+        self.format = format
+        self.verbose = verbose
+        self.outFile = out_file
+        self.local = threading.local()
+        if out_file is not None:
+            self.out = open(out_file, "w", encoding="utf-8", newline="" if format == "csv" else None)
+            if format == "csv":
+                csv.writer(self.out).writerow(self.columns)
+
+    def enabled(self, level):
+        return level <= self.verbose
+
+    """
+    Repository and branch of the items this thread reports from now on
+    """
+    def scan(self, repo, branch):
+        self.local.scan = dict(repo=repo, branch=branch)
+
+    """
+    Report item of kind, if level is within the verbosity level
+    """
+    def item(self, level, kind, **fields):
+        if level > self.verbose:
+            return
+        scan = getattr(self.local, "scan", None)
+        if scan is not None and self.format != "text":
+            fields = dict(scan, **fields)
+        with self.lock:
+            self.nItem += 1
+            self.buffer.append((kind, fields))
+            if self.out is None or len(self.buffer) >= self.bufferItems:
+                self.write()
+
+    """
+    Report a message, text % args, formatted only when written
+    """
+    def message(self, level, text, *args):
+        if level > self.verbose:
+            return
+        self.item(level, "message", text=text, args=args)
+
+    """
+    Write buffered items, lock held
+    """
+    def write(self):
+        items = self.buffer
+        self.buffer = []
+        out = self.out if self.out is not None else sys.stdout
+        if self.format == "text":
+            lines = []
+            for kind, fields in items:
+                if kind == "message":
+                    lines.append(fields["text"] % fields["args"] if fields["args"] else fields["text"])
+                    continue
+                for name in self.timeFields[kind]:
+                    if fields[name] is not None:
+                        fields[name] = datetime.datetime.fromtimestamp(fields[name])
+                lines.append(REPORT_KINDS[kind][0] % fields)
+            lines.append("")
+            out.write("\n".join(lines))
+            return
+        
+        rows = []
+        for kind, fields in items:
+            if kind == "message":
+                fields = dict(fields, text=fields["text"] % fields["args"] if fields["args"] else fields["text"])
+                del fields["args"]
+            for name, value in fields.items():
+                if isinstance(value, datetime.datetime):
+                    fields[name] = dateToCacheStr(value)
+            rows.append((kind, fields))
+        if self.format == "csv":
+            columns = self.columns[1:]
+            csv.writer(out).writerows([[kind] + [fields.get(column, "") for column in columns]
+                                       for kind, fields in rows])
+        else:
+            out.write("".join(json.dumps(dict(kind=kind, **fields)) + "\n" for kind, fields in rows))
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.write()
+        out = self.out if self.out is not None else sys.stdout
+        out.flush()
+
+    def close(self):
+        self.flush()
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+            print("%d report items are in %s" % (self.nItem, os.path.abspath(self.outFile)))
+
+
+reporter = Reporter()                       # This run's report
+
+
+"""
+Central GitHub request scheduler
+Installed on a PyGithub Requester so every request made through it,
+including lazy completion and pagination, passes here.
+Tracks X-RateLimit-Remaining / Reset, paces requests to spread
+what remains of the budget over the rest of the window once it runs
+low, retries rate limited (403, 429), failed (5xx) and dropped requests
+with jittered exponential backoff, and limits requests in flight.
+"""
+class RequestScheduler:
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    
+    def __init__(self, maxInFlight=10, maxRetries=6, backoffBase=1.0, backoffMax=60.0,
+                 paceBelow=0.2, stats=None, verbose=0):
+        self.maxInFlight = maxInFlight
+        self.stats = stats                  # RunStats, None - no request statistics
+        self.maxRetries = maxRetries
+        self.backoffBase = backoffBase      # First retry delay, seconds
+        self.backoffMax = backoffMax
+        self.paceBelow = paceBelow          # Pace once remaining budget is below this fraction
+        self.verbose = verbose
+        self.inFlight = threading.BoundedSemaphore(maxInFlight)
+        self.lock = threading.Lock()
+        self.rnd = random.Random()
+        self.nextTime = 0.                  # Earliest start of next request, when pacing
+        self.remaining = None               # From the latest response
+        self.limit = None
+        self.resetTime = None
+        self.startRemaining = None
+        self.nRequest = 0
+        self.nRetry = 0
+        self.waitTime = 0.                  # Seconds spent pacing and backing off
+
+    """
+    Route requester's requests through this scheduler
+    The raw request methods are wrapped, the ...AndCheck methods use them
+    """
+    def attach(self, requester):
+        if getattr(requester, "_scheduler", None) is self:
+            return
+        for name in ("requestJson", "requestMultipart", "requestBlob"):
+            method = getattr(requester, name, None)
+            if method is not None:
+                setattr(requester, name, self.wrap(method))
+        shareConnection(requester)
+        requester._scheduler = self
+
+    def wrap(self, method):
+        def scheduled(*args, **kwargs):
+            return self.request(method, *args, **kwargs)
+        return scheduled
+
+    """
+    Make request, method returning (status, headers, output),
+    retrying as needed
+    """
+    def request(self, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.pace()
+            error = None
+            with self.inFlight:
+                request_start = time.time()
+                try:
+                    status, headers, output = method(*args, **kwargs)
+                except OSError as e:        # Includes dropped connections, timeouts
+                    error = e
+                    status, headers, output = None, {}, ""
+                request_time = time.time() - request_start
+            with self.lock:
+                self.nRequest += 1
+            if self.stats is not None and len(args) >= 2:
+                self.stats.addRequest(args[0], args[1], status, len(output) if output else 0, request_time)
+            self.update(headers)
+            delay = self.retryDelay(status, headers, output, attempt)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return status, headers, output
+            
+            attempt += 1
+            with self.lock:
+                self.nRetry += 1
+                self.waitTime += delay
+            print("request %s %s: %s - retry %d in %.1f sec"
+                  % (args[0] if args else "", args[1] if len(args) > 1 else "",
+                     status if error is None else repr(error), attempt, delay))
+            time.sleep(delay)
+
+    """
+    Seconds to wait before retrying, None if not to be retried
+    """
+    def retryDelay(self, status, headers, output, attempt):
+        if attempt >= self.maxRetries:
+            return None
+        if status is not None and status != 403 and status not in self.RETRY_STATUS:
+            return None
+        
+        if status == 403:
+            if isinstance(output, bytes):
+                output = output.decode("utf-8", "replace")
+            if "rate limit" not in output.lower():
+                return None                 # Real permission failure
+            
+        retry_after = responseHeader(headers, "Retry-After")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        with self.lock:
+            if self.remaining == 0 and self.resetTime is not None:
+                return max(self.resetTime - time.time(), 0) + 1.
+        delay = min(self.backoffMax, self.backoffBase * 2**attempt)
+        return delay/2 + self.rnd.uniform(0, delay/2)
+
+    def update(self, headers):
+        remaining = responseHeader(headers, "X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        with self.lock:
+            self.remaining = int(remaining)
+            if self.startRemaining is None:
+                self.startRemaining = self.remaining + 1
+            limit = responseHeader(headers, "X-RateLimit-Limit")
+            if limit is not None:
+                self.limit = int(limit)
+            reset = responseHeader(headers, "X-RateLimit-Reset")
+            if reset is not None:
+                self.resetTime = int(reset)
+
+    """
+    Wait, if need be, so the remaining budget lasts until the reset
+    """
+    def pace(self):
+        with self.lock:
+            if self.remaining is None or self.limit is None or self.resetTime is None:
+                return
+            
+            now = time.time()
+            to_reset = max(self.resetTime - now, 0)
+            if self.remaining <= 0:
+                wait = to_reset
+            elif self.remaining >= self.paceBelow * self.limit:
+                return
+            else:
+                start = max(now, self.nextTime)
+                self.nextTime = start + to_reset / self.remaining
+                wait = start - now
+            self.waitTime += wait
+        if wait > 0:
+            if self.verbose > 0:
+                print("pacing: %d requests left, waiting %.2f sec" % (self.remaining, wait))
+            time.sleep(wait)
+
+    def report(self):
+        used = 0
+        if self.startRemaining is not None and self.remaining is not None:
+            used = self.startRemaining - self.remaining
+        print("%d API requests, %d retries, %.1f sec waiting, rate limit: %s of %s left (%d used)"
+              % (self.nRequest, self.nRetry, self.waitTime, self.remaining, self.limit, used))
+        if self.stats is not None:
+            self.stats.rateLimit = dict(requests=self.nRequest, retries=self.nRetry, waitSeconds=self.waitTime,
+                                        remaining=self.remaining, limit=self.limit, used=used,
+                                        resetTime=self.resetTime)
+
+
+"""
+The Requester shared by all objects from a Github instance
+"""
+def githubRequester(gH):
+    return gH._Github__requester
+
+
+"""
+Requester's persistent connection, shared by threads
+PyGithub keeps one connection, a pooled requests session, per Requester
+and reuses it for every request, but stores each request on it between
+request() and getresponse(), so concurrent requests can get each
+other's responses.  Each thread gets its own copy of the connection,
+holding its request, with the one session and connection pool shared.
+"""
+class SharedConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.local = threading.local()
+
+    def threadConnection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = copy.copy(self.connection)     # Same session
+            self.local.connection = connection
+        return connection
+
+    def request(self, verb, url, input, headers):
+        self.threadConnection().request(verb, url, input, headers)
+
+    def getresponse(self):
+        return self.threadConnection().getresponse()
+
+    def close(self):
+        self.threadConnection().close()
+
+
+"""
+Make requester's persistent connection safe to share between threads
+"""
+def shareConnection(requester):
+    if not getattr(requester, "_Requester__persist", False):
+        return                      # A new connection per request
+    connection = requester._Requester__createConnection()
+    if not isinstance(connection, SharedConnection):
+        requester._Requester__connection = SharedConnection(connection)
+
+
+"""
+Stream the items of a PaginatedList, page by page
+Pages are fetched, in a background thread, up to window pages ahead
+of the page being processed.  Unlike iterating the PaginatedList,
+nothing is kept once processed, so memory is bounded by the window
+no matter how long the list.
+"""
+class PageStream:
+    def __init__(self, paginated, window=2, verbose=0):
+        self.paginated = paginated
+        self.window = window
+        self.verbose = verbose
+        self.queue = queue.Queue(maxsize=window)
+        self.stopped = threading.Event()
+        self.nPage = 0                      # Pages processed
+        self.nItem = 0                      # Items taken, some only prefetched by the consumer
+        
+    """
+    Total item count from the Link header (one small request)
+    """
+    def totalCount(self):
+        return self.paginated.totalCount
+        
+    """
+    True if page is the last: short, or its Link header has no next page
+    (GitHub sends no Link header for a single page)
+    """
+    def lastPage(self, page):
+        per_page = self.paginated._PaginatedList__requester.per_page
+        if len(page) < per_page:
+            return True
+        link = responseHeader(page[-1]._headers, "Link")
+        return link is None or 'rel="next"' not in link
+        
+    def fetcher(self):
+        page_no = 0
+        try:
+            while not self.stopped.is_set():
+                page = self.paginated.get_page(page_no)
+                page_no += 1
+                self.put(page)
+                if self.lastPage(page):
+                    self.put([])            # End marker, no request
+                    return
+        except Exception as e:
+            self.put(e)                     # Raised to the consumer
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=.1)
+                return
+            except queue.Full:
+                continue
+    
+    def pages(self):
+        thread = threading.Thread(target=self.fetcher, daemon=True)
+        thread.start()
+        try:
+            while True:
+                page = self.queue.get()
+                if isinstance(page, Exception):
+                    raise page
+                if len(page) == 0:
+                    return
+                self.nPage += 1
+                if self.verbose > 1:
+                    print("page %d: %d items" % (self.nPage, len(page)))
+                yield page
+        finally:
+            self.close()
+    
+    def __iter__(self):
+        for page in self.pages():
+            for item in page:
+                self.nItem += 1
+                yield item
+    
+    """
+    Stop prefetching, e.g. on early loop exit
+    """
+    def close(self):
+        self.stopped.set()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+
+"""
+Commits up to, not including, stopSha
+"""
+def commitsUntil(commits, stopSha=None):
+    for commit in commits:
+        if stopSha is not None and commit.sha == stopSha:
+            print("commit %s already processed" % stopSha)
+            return
+        yield commit
+
+
+def fetchCommitFiles(commit):
+    return commit.files                     # Completes commit, one request
+
+
+"""
+Fetch commit details (files) concurrently
+Generates (commit, files) in commit order, while the details of up to
+window following commits are fetched by nWorker threads.
+close() cancels fetches not yet needed, e.g. on early loop exit.
+"""
+class CommitDetailFetcher:
+    def __init__(self, commits, nWorker=8, window=None, fetch=fetchCommitFiles, verbose=0):
+        self.commits = iter(commits)
+        self.nWorker = max(nWorker, 1)
+        self.window = window
+        if self.window is None:
+            self.window = 2 * self.nWorker
+        self.fetch = fetch
+        self.verbose = verbose
+        self.executor = None
+        self.pending = deque()              # (commit, future) in commit order
+        self.nFetched = 0
+        self.nCancelled = 0
+
+    def fill(self):
+        while len(self.pending) < self.window:
+            commit = next(self.commits, None)
+            if commit is None:
+                return
+            self.pending.append((commit, self.executor.submit(self.fetch, commit)))
+
+    def __iter__(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.nWorker)
+        try:
+            self.fill()
+            while self.pending:
+                commit, future = self.pending.popleft()
+                result = future.result()
+                self.nFetched += 1
+                self.fill()
+                yield commit, result
+        finally:
+            self.close()
+
+    def close(self):
+        if self.executor is None:
+            return
+        for commit, future in self.pending:
+            if future.cancel():
+                self.nCancelled += 1
+        self.pending.clear()
+        self.executor.shutdown(wait=False)
+        self.executor = None
+        if self.verbose > 0 and self.nCancelled > 0:
+            print("%d commit fetches cancelled" % self.nCancelled)
 
 
 """
 Process file
 Determine latest commit date for this file in the current branch
+Kept small for trees with a million files: slots, no per instance dict,
+the path is the fileDict key string itself, name and key are derived,
+the type string is interned and the blob sha held as 20 bytes.
 """
 class CommittedFile:
+    __slots__ = ("filePath", "fileType", "fileSize", "shaBytes", "date")
+    
     def __init__(self, dir_content_file):
-        self.fileName = dir_content_file.name
-        self.fileType = dir_content_file.type
-        self.fileSize = dir_content_file.size
         self.filePath = dir_content_file.path
-        self.fileSha = dir_content_file.sha
-        self.key = self.filePath
+        self.fileType = sys.intern(dir_content_file.type)
+        self.fileSize = dir_content_file.size
+        sha = dir_content_file.sha
+        self.shaBytes = bytes.fromhex(sha) if sha is not None else None
         self.date = None
 
+    @property
+    def fileName(self):
+        return self.filePath.rsplit("/", 1)[-1]
+
+    @property
+    def key(self):
+        return self.filePath
+
+    """
+    blob sha as hex, as GitHub gives it
+    """
+    @property
+    def fileSha(self):
+        if self.shaBytes is None:
+            return None
+        return self.shaBytes.hex()
+
+
+"""
+Last modified date of paths in a branch's history: the date of the
+newest commit that added, changed or renamed a file to the path.
+Built in one pass over the history, newest commit first, so the first
+commit seen touching a path decides it.  Removed paths, and the old
+paths of renames, are kept undated so older commits can't date them.
+The blob sha the commit left at the path is kept, to check that a date
+applies to the content of a tree.
+Lookup by path is a dict access, by directory a bisect of the sorted paths.
+"""
+class CommitDateIndex:
+    def __init__(self):
+        self.entries = {}                   # path : (date, blob sha), (None, None) - removed
+        self.sortedPaths = None             # For datesUnder, None - not yet sorted
+        self.nCommit = 0
+
+    """
+    Index commit's files (filename, status, sha, previous_filename),
+    returning the paths decided by this commit
+    """
+    def addCommit(self, commit_date, commit_files):
+        self.nCommit += 1
+        decided = []
+        for commit_file in commit_files:
+            if commit_file.status == "renamed" and commit_file.previous_filename:
+                self.decide(commit_file.previous_filename, None, None, decided)
+            if commit_file.status == "removed":
+                self.decide(commit_file.filename, None, None, decided)
+            else:
+                self.decide(commit_file.filename, commit_date, commit_file.sha, decided)
+        return decided
+
+    def decide(self, path, date, sha, decided):
+        if path in self.entries:
+            return                          # Newer commit decided
+        self.entries[path] = (date, sha)
+        self.sortedPaths = None
+        decided.append(path)
+
+    """
+    Set path's date found otherwise, e.g. from the path's own history
+    """
+    def setDate(self, path, date, sha):
+        if path not in self.entries:
+            self.sortedPaths = None
+        self.entries[path] = (date, sha)
+
+    """
+    Add the entries of older, an index of earlier history,
+    for paths not decided here
+    """
+    def update(self, older):
+        for path, entry in older.entries.items():
+            if path not in self.entries:
+                self.entries[path] = entry
+                self.sortedPaths = None
+
+    """
+    (date, blob sha) of path, (None, None) if removed or not indexed
+    """
+    def entry(self, path):
+        return self.entries.get(path, (None, None))
+
+    def date(self, path):
+        return self.entry(path)[0]
+
+    """
+    Generate (path, date), in path order, of dated paths below
+    directory dir_path, "" - all paths
+    """
+    def datesUnder(self, dir_path=""):
+        if self.sortedPaths is None:
+            self.sortedPaths = sorted(self.entries)
+        paths = self.sortedPaths
+        prefix = dir_path.rstrip("/")
+        if prefix != "":
+            prefix += "/"
+        index = bisect.bisect_left(paths, prefix)
+        while index < len(paths) and paths[index].startswith(prefix):
+            date = self.entries[paths[index]][0]
+            if date is not None:
+                yield paths[index], date
+            index += 1
+
+    """
+    Newest date below directory dir_path, None if none
+    """
+    def lastModified(self, dir_path=""):
+        return max((date for path, date in self.datesUnder(dir_path)), default=None)
+
+
+"""
+Git tree element types to the ContentFile types used by get_dir_contents
+"""
+treeTypes = {"blob" : "file", "tree" : "dir", "commit" : "submodule"}
+
+"""
+Stand in for a ContentFile, built from a git tree element, so that
+CommittedFile records are the same for either listing method
+"""
+class TreeEntry:
+    def __init__(self, tree_element, dir_path=""):
+        path = tree_element.path
+        if dir_path != "":
+            path = dir_path + "/" + path            # Subtree paths are relative
+        self.path = path
+        self.name = path.split("/")[-1]
+        self.type = treeTypes.get(tree_element.type, tree_element.type)
+        if tree_element.mode == "120000":
+            self.type = "symlink"
+        self.size = tree_element.size
+        if self.size is None:
+            self.size = 0                           # Trees have no size
+        self.sha = tree_element.sha
+        self.mode = tree_element.mode
+
+
+"""
+List a whole tree with recursive git tree requests
+One request for the whole tree unless GitHub truncates the response,
+in which case the tree is listed one level and each subtree
+is fetched, again recursively, the same way.
+"""
+class TreeLister:
+    def __init__(self, repo, verbose=0):
+        self.repo = repo
+        self.verbose = verbose
+        self.nApiCall = 0                   # Count of tree requests
+        self.nTruncated = 0                 # Count of truncated responses
+
+    def getTree(self, tree_sha, recursive=False):
+        self.nApiCall += 1
+        if recursive:
+            return self.repo.get_git_tree(tree_sha, recursive=True)
+        return self.repo.get_git_tree(tree_sha)
+
+    """
+    Generate TreeEntry for every element (files and directories)
+    below tree_sha, tree_sha may be a sha or a branch name
+    """
+    def entries(self, tree_sha, dir_path=""):
+        tree = self.getTree(tree_sha, recursive=True)
+        if not tree.raw_data.get("truncated", False):
+            for tree_element in tree.tree:
+                yield TreeEntry(tree_element, dir_path)
+            return
+        
+        self.nTruncated += 1
+        if self.verbose > 0:
+            print("tree %s(%s) truncated - listing subtrees" % (dir_path, tree_sha))
+        yield from self.subtreeEntries(tree_sha, dir_path)
+
+    """
+    List one level, fetching each subtree separately
+    """
+    def subtreeEntries(self, tree_sha, dir_path=""):
+        tree = self.getTree(tree_sha)
+        for tree_element in tree.tree:
+            entry = TreeEntry(tree_element, dir_path)
+            yield entry
+            if entry.type == "dir":
+                yield from self.entries(tree_element.sha, entry.path)
+
 """
 Accumulate and access all committed files for a particular branch
 File information is stored as required
 """
 class CommittedFiles:
-    def __init__(self, repo, branchName="master", verbose=0):
+    def __init__(self, repo, branchName="master", verbose=0, nFetcher=8):
         self.repo = repo
         self.branchName = branchName
         self.verbose = verbose
+        self.nFetcher = nFetcher            # Concurrent commit detail requests
         self.fileDict = {};                 # Stored by path : CommittedFile
         self.nFile = 0
         self.nDated = 0                     # Count of dated
+        self.nApiCall = 0                   # Count of listing requests
+        self.headSha = None                 # Newest commit processed for dates
+        self.headDate = None
+        self.sortedKeys = None              # Sorted paths for filesUnder, None - not yet sorted
+        self.dateIndex = CommitDateIndex()  # Of the history processed for dates
         """
         Add all contained files
         """
@@ -97,35 +1054,47 @@ class CommittedFiles:
                 
                 
     def collectFile(self, dir_content_file):
-        if self.verbose > 0:
-            print("%s %s %d %s" %(dir_content_file.name, dir_content_file.type, dir_content_file.size, dir_content_file.path))
+        reporter.item(1, "remote", path=dir_content_file.path, type=dir_content_file.type,
+                      size=dir_content_file.size)
         self.addFile(dir_content_file)
             
             
     """
-    Get latest commit date for all files in fileDict
+    Get latest commit date for all undated files in fileDict, adding
+    the commits processed, newest first, to dateIndex
+    A file is dated by the first commit touching its path, if that left
+    the file's content (blob sha), else it is left for collectPathDates
+    stopSha: stop at this, already processed, commit
+    since: only commits from this date (of stopSha)
+    maxUndated: stop when no more than this many files are undecided,
+        leaving them for collectPathDates
     """
-    def collectCommitDates(self):
+    def collectCommitDates(self, stopSha=None, since=None, maxUndated=0):
         nshow = 0
-        commits = self.repo.get_commits()
         if self.verbose > 0:
             print("%d files" % self.nFile)
-        ncommit = 0
-        commits = self.repo.get_commits()
-        ncommit = 0
-        for commit in commits:
-            ncommit += 1
-        print("%d commits" % ncommit)
+        if since is not None:
+            commits = self.repo.get_commits(sha=self.branchName, since=since)
+        else:
+            commits = self.repo.get_commits(sha=self.branchName)
+        commit_stream = PageStream(commits, verbose=self.verbose)
+        if self.verbose > 2:
+            print("%d commits" % commit_stream.totalCount())      # An extra request
             
-        contag = "/contents/"
-        contag_len = len(contag)
-        for commit in commits:
-            nshow += 1
-            if self.nDated >= self.nFile:
+        undecided = set(file.filePath for file in self.fileDict.values() if file.date is None)
+        fetcher = CommitDetailFetcher(commitsUntil(commit_stream, stopSha), nWorker=self.nFetcher,
+                                      verbose=self.verbose)
+        for commit, commit_files in fetcher:
+            if len(undecided) == 0:
                 if self.verbose > 0:
                     print("All %d files have commit dates" % self.nFile)
-                    break
+                break
+            
+            if len(undecided) <= maxUndated:
+                print("%d files left undated after %d commits" % (len(undecided), nshow))
+                break
                 
+            nshow += 1
             if self.verbose > 1:
                 cod = obj_desc(commit)
                 print("\ncommit %d" % (nshow))
@@ -134,38 +1103,73 @@ class CommittedFiles:
             git_committer = git_commit.committer
             commit_date = git_committer.date
             comment_str = git_commit.message
-            if self.verbose > 0:
-                print("commit %d: %s %s %s" % (nshow, commit_date, git_committer.name, comment_str))
-            commit_files = commit.files
-            for commit_file in commit_files:
-                commit_file_name = commit_file.filename
-                commit_file_sha = commit_file.sha
-                contents_url = commit_file.contents_url
-                contents_path = contents_url.split("?")[0]
-                path_index = contents_path.find(contag)
-                if (path_index < 0):
+            if self.headSha is None:
+                self.headSha = commit.sha
+                self.headDate = commit_date
+            reporter.item(1, "commit", count=nshow, date=commit_date, committer=git_committer.name,
+                          message=comment_str)
+            for path in self.dateIndex.addCommit(commit_date, commit_files):
+                if path not in undecided:
+                    reporter.message(2, "commit %d: file %s is not an undated stored file - ignored", nshow, path)
                     continue
-                path = contents_path[path_index+contag_len:]
-                key = path
-                file = self.fileEntry(key=key)
-                if file == None:
-                    print("commit %d: file %s(%s) is not in stored files - ignored" % (nshow, path, commit_file_name))
-                    print("    %s %s %s" % (commit_date, git_committer, comment_str))
-                    continue
- 
-                if file.date is not None:
-                    continue                                # Date already obtained
                 
-                file_sha = file.fileSha
-                if (commit_file_sha != file_sha):
-                    if self.verbose > 0:
-                        print("%s commit file sha (%s) != file sha(%s) - ignored" % (path, commit_file_sha, file_sha))
+                undecided.discard(path)
+                file = self.fileDict[path]
+                date, sha = self.dateIndex.entry(path)
+                if date is None or sha != file.fileSha:
+                    reporter.message(1, "%s commit file sha (%s) != file sha(%s) - left undated",
+                                     path, sha, file.fileSha)
                     continue
                 file.date = commit_date
                 self.nDated += 1
-                if self.verbose > 0:
-                    print("%s (%s) date: %s   nDate: %d of %d" % (file.fileName, file.filePath, file.date, self.nDated, self.nFile))
-        
+                reporter.item(1, "dated", path=path, source="commit", date=commit_date, count=self.nDated,
+                              total=self.nFile)
+        fetcher.close()
+        commit_stream.close()
+        print("%d commits processed, %d listed in %d pages" % (nshow, commit_stream.nItem, commit_stream.nPage))
+
+    """
+    Get dates of remaining undated files from each file's own history
+    One request per file, cheaper than scanning all history for a few files
+    """
+    def collectPathDates(self):
+        for file in self.fileDict.values():
+            if file.date is not None:
+                continue
+            
+            commits = self.repo.get_commits(sha=self.branchName, path=file.filePath)
+            page = commits.get_page(0)
+            if len(page) == 0:
+                reporter.message(1, "%s has no commits", file.filePath)
+                continue
+            
+            file.date = page[0].commit.committer.date       # Latest change
+            self.dateIndex.setDate(file.filePath, file.date, file.fileSha)
+            self.nDated += 1
+            reporter.item(1, "dated", path=file.filePath, source="path", date=file.date, count=self.nDated,
+                          total=self.nFile)
+
+    """
+    Date undated files from index, an index of earlier history, where
+    their content (blob sha) is as indexed, returning number dated
+    """
+    def applyIndex(self, index):
+        ndated = 0
+        for file in self.fileDict.values():
+            if file.date is not None:
+                continue
+            date, sha = index.entry(file.filePath)
+            if date is None or sha != file.fileSha:
+                continue
+            file.date = date
+            self.nDated += 1
+            ndated += 1
+        return ndated
+
+    """
+    List files without dates
+    """
+    def listUndated(self):
         n_undated = self.nFile-self.nDated            
         if self.nDated < self.nFile:
             print("%d files have no commit dates" % n_undated)
@@ -175,96 +1179,1121 @@ class CommittedFiles:
                     print("No entry for key=%s" % key)
                 fileDate = file.date
                 if fileDate is None:
-                    fileName = file.fileName
-                    filePath = file.filePath
-                    print("    %s (%s)" % (fileName, filePath))
+                    reporter.item(0, "undated", path=file.filePath)
                 
                          
     """
-    Process directory
-    Default - "" - top level directory
+    Process directory
+    Default - "" - top level directory
+    """
+    def collectDir(self, dir_content_file=""):
+        if hasattr(dir_content_file, "name"):            
+            print("%s %s %d %s" %(dir_content_file.name, dir_content_file.type, dir_content_file.size, dir_content_file.path))
+            dir_path = dir_content_file.path
+        else:
+            dir_path = dir_content_file
+            
+        dir_contents = self.repo.get_dir_contents(dir_path)
+        if self.verbose > 0:
+            print("dir_path: %s" % (dir_path))
+                                                        # First process directories, recursively
+        for dir_content_file in dir_contents:
+            if dir_content_file.type == "dir":
+                self.collectDir(dir_content_file)
+
+        for dir_content_file in dir_contents:
+            if dir_content_file.type != "dir":
+                self.collectFile(dir_content_file)
+
+
+    """
+    Collect all files in branch from the branch's git tree
+    Replaces the directory by directory collectDir with, usually,
+    a single request
+    """
+    def collectTree(self, tree_sha=None):
+        if tree_sha is None:
+            tree_sha = self.branchName
+        lister = TreeLister(self.repo, verbose=self.verbose)
+        for entry in lister.entries(tree_sha):
+            if entry.type == "dir" or entry.type == "submodule":
+                continue
+            self.collectFile(entry)
+        self.nApiCall = lister.nApiCall
+        print("%d files listed in %d API calls" % (self.nFile, self.nApiCall))
+        
+        
+    """
+    """        
+    def getCommitDate(self, fileName):
+        pass
+
+    """
+    Add file to Committed Files
+    """        
+
+    def addFile(self, dir_content_file):
+        cf = CommittedFile(dir_content_file)
+        dict_ent = self.fileEntry(committedFile=cf)
+        if dict_ent:
+            dict_file_name = dict_ent.fileName
+            dict_file_path = dict_ent.filePath
+            print("%s name %s path is already present (%s %s) - ignored" % (cf.fileName, cf.filePath, dict_file_name, dict_file_path))
+            return
+        
+        key = cf.filePath    
+        self.fileDict[key] = cf
+        self.nFile += 1
+        self.sortedKeys = None
+
+    """
+    Return entry if CommittedFile key matches, else None
+    """
+    def fileEntry(self, key=None, committedFile=None):
+        if key is None:
+            key = committedFile.key
+        return self.fileDict.get(key)
+
+    """
+    Generate entries, in path order, of files below directory dir_path
+    "" - all files
+    """
+    def filesUnder(self, dir_path=""):
+        if self.sortedKeys is None:
+            self.sortedKeys = sorted(self.fileDict)
+        keys = self.sortedKeys
+        prefix = dir_path.rstrip("/")
+        if prefix != "":
+            prefix += "/"
+        index = bisect.bisect_left(keys, prefix)
+        while index < len(keys) and keys[index].startswith(prefix):
+            yield self.fileDict[keys[index]]
+            index += 1
+
+    """
+    Save files to a tree manifest, for offline comparison
+    A header line:
+        #github_files tree<TAB>repo<TAB>branch<TAB>head sha<TAB>head date
+    then a line per file:
+        sha<TAB>size<TAB>type<TAB>date<TAB>path
+    date "-" if none, path JSON quoted if it contains a newline
+    or starts with a quote
+    """
+    def saveManifest(self, manifest_file, repoName):
+        with open(manifest_file, "w", encoding="utf-8", newline="\n") as fout:
+            fout.write("%s\t%s\t%s\t%s\t%s\n"
+                       % (MANIFEST_HEADER, repoName, self.branchName, self.headSha or "-",
+                          dateToCacheStr(self.headDate) if self.headDate is not None else "-"))
+            for file in self.fileDict.values():
+                path = file.filePath
+                if "\n" in path or path.startswith('"'):
+                    path = json.dumps(path)
+                fout.write("%s\t%d\t%s\t%s\t%s\n"
+                           % (file.fileSha, file.fileSize, file.fileType,
+                              dateToCacheStr(file.date) if file.date is not None else "-", path))
+        print("%d files saved to %s" % (self.nFile, os.path.abspath(manifest_file)))
+
+    """
+    Load files from tree manifest made by saveManifest
+    Returns repository name
+    """
+    def loadManifest(self, manifest_file):
+        with open(manifest_file, encoding="utf-8", newline="\n") as fin:
+            header = fin.readline().rstrip("\n").split("\t")
+            if header[0] != MANIFEST_HEADER or len(header) != 5:
+                raise Exception("%s is not a tree manifest" % manifest_file)
+            repo_name, self.branchName, head_sha, head_date = header[1:]
+            if head_sha != "-":
+                self.headSha = head_sha
+            if head_date != "-":
+                self.headDate = cacheStrToDate(head_date)
+            for line in fin:
+                sha, size, type, date_str, path = line.rstrip("\n").split("\t", 4)
+                if path.startswith('"'):
+                    path = json.loads(path)
+                self.addFile(FileEntry(path, type, int(size), sha))
+                if date_str != "-":
+                    self.fileDict[path].date = cacheStrToDate(date_str)
+                    self.nDated += 1
+        print("%d files of %s(%s) loaded from %s" % (self.nFile, repo_name, self.branchName, manifest_file))
+        return repo_name
+
+
+"""
+repo_date to local date string
+"""
+def repoDateToLocalStr(repo_date):
+    repo_time = repo_date.replace(tzinfo=timezone.utc).timestamp()                
+    repo_date_str = datetime.datetime.fromtimestamp(repo_time)
+    return repo_date_str
+
+"""
+repo date to local time stamp
+"""
+def repoDateToLocalTime(repo_date):
+    repo_time = repo_date.replace(tzinfo=timezone.utc).timestamp()                
+    return repo_time
+
+
+"""
+git blob sha (hex) of local file, as found in CommittedFile.fileSha
+sha1 of "blob <len>\0<content>", read in chunks so large
+files are never held in memory
+"""
+BLOB_CHUNK_SIZE = 1024*1024
+
+def gitBlobSha(file_path, file_size=None):
+    if file_size is None:
+        file_size = os.path.getsize(file_path)
+    sha = hashlib.sha1(b"blob %d\0" % file_size)
+    buf = bytearray(BLOB_CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(file_path, "rb") as fin:
+        while True:
+            nread = fin.readinto(buf)
+            if not nread:
+                break
+            sha.update(view[:nread])
+    return sha.hexdigest()
+
+
+"""
+Local file, as found by LocalScanner
+rpath is the repository style path ("/" separated, relative to scan root)
+"""
+class LocalFile:
+    def __init__(self, lpath, rpath, stat):
+        self.lpath = lpath
+        self.rpath = rpath
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mtimeNs = stat.st_mtime_ns
+        self.inode = stat.st_ino
+        self.sha = None                     # git blob sha, if hashed
+
+
+"""
+Persistent local hash cache
+(path, size, mtime_ns, inode) : git blob sha, kept in an sqlite file
+so a rescan only rehashes files which have changed.
+"""
+class HashCache:
+    RACY_SECONDS = 2                        # Too recently modified to trust
+    
+    def __init__(self, cache_file, verbose=0):
+        self.cacheFile = cache_file
+        self.verbose = verbose
+        self.entries = {}                   # path : (size, mtime_ns, inode, sha)
+        self.updated = {}                   # path : entry, to be saved
+        self.seen = set()
+        self.nHit = 0
+        self.nMiss = 0
+        self.db = sqlite3.connect(cache_file, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS hashes"
+                        " (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+                        " inode INTEGER, sha TEXT)")
+        for row in self.db.execute("SELECT path, size, mtime_ns, inode, sha FROM hashes"):
+            self.entries[row[0]] = row[1:]
+        if self.verbose > 0:
+            print("%d entries in hash cache %s" % (len(self.entries), cache_file))
+
+    """
+    Return cached sha if file is unchanged, else None
+    """
+    def lookup(self, local_file):
+        self.seen.add(local_file.lpath)
+        entry = self.entries.get(local_file.lpath)
+        if (entry is not None and entry[0] == local_file.size
+                and entry[1] == local_file.mtimeNs and entry[2] == local_file.inode):
+            self.nHit += 1
+            return entry[3]
+        self.nMiss += 1
+        return None
+    
+    def update(self, local_file, scan_time=None):
+        if scan_time is None:
+            scan_time = time.time()
+        if local_file.mtime > scan_time - self.RACY_SECONDS:
+            return                          # Could change again unnoticed, in the same mtime
+        entry = (local_file.size, local_file.mtimeNs, local_file.inode, local_file.sha)
+        self.entries[local_file.lpath] = entry
+        self.updated[local_file.lpath] = entry
+
+    """
+    Save updates, dropping entries under root_dir which were not seen
+    """
+    def save(self, root_dir=None):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                                [(path,) + entry for path, entry in self.updated.items()])
+            if root_dir is not None:
+                root_prefix = os.path.join(root_dir, "")
+                gone = [(path,) for path in self.entries
+                        if path.startswith(root_prefix) and path not in self.seen]
+                self.db.executemany("DELETE FROM hashes WHERE path = ?", gone)
+        self.updated = {}
+
+    def close(self):
+        runStats.addCounts("hashCache", hits=self.nHit, misses=self.nMiss)
+        self.db.close()
+
+
+def hashWorker(file_path, file_size):
+    return gitBlobSha(file_path, file_size)
+
+
+"""
+gitignore style glob to regular expression
+"*" and "?" do not match "/", "**/" matches any leading directories,
+a final "/**" everything below
+"""
+def globToRegex(glob):
+    regex = []
+    index = 0
+    nchar = len(glob)
+    while index < nchar:
+        char = glob[index]
+        at_start = index == 0 or glob[index-1] == "/"
+        if glob.startswith("**/", index) and at_start:
+            regex.append("(?:.*/)?")
+            index += 3
+            continue
+        if glob.startswith("**", index) and at_start and index+2 == nchar:
+            regex.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            regex.append("[^/]*")
+            while index+1 < nchar and glob[index+1] == "*":
+                index += 1
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "[":
+            start = index + 1
+            if glob[start:start+1] in ("!", "^"):
+                start += 1
+            if glob[start:start+1] == "]":
+                start += 1
+            end = glob.find("]", start)
+            if end < 0:
+                regex.append("\\[")
+            else:
+                body = glob[index+1:end]
+                if body[0] in ("!", "^"):
+                    body = "^" + body[1:]
+                regex.append("[" + body + "]")
+                index = end
+        elif char == "\\" and index+1 < nchar:
+            index += 1
+            regex.append(re.escape(glob[index]))
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return "".join(regex)
+
+
+"""
+Rule from a gitignore line, None for blanks and comments
+base_dir: directory of the .gitignore, relative to the root, "" or ending in "/"
+Returns (regex matching root relative paths, negate, dir only)
+"""
+def ignoreRule(line, base_dir=""):
+    line = line.rstrip("\r\n")
+    if not line.endswith("\\ "):
+        line = line.rstrip(" ")
+    if line == "" or line.startswith("#"):
+        return None
+    negate = False
+    if line.startswith("!"):
+        negate = True
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if line == "":
+        return None
+    anchored = "/" in line              # Relative to base_dir, else matches at any level
+    regex = globToRegex(line.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return (re.escape(base_dir) + regex, negate, dir_only)
+
+
+"""
+Ignore rules in effect in a directory, in order, the last matching rule decides
+Without negated rules all rules are combined into one regular expression
+"""
+class IgnoreList:
+    def __init__(self, rules):
+        self.rules = rules
+        self.hasNegation = False
+        for regex, negate, dir_only in rules:
+            if negate:
+                self.hasNegation = True
+        if self.hasNegation:
+            self.compiled = [(re.compile(regex), negate, dir_only) for regex, negate, dir_only in rules]
+        else:
+            self.fileRegex = self.combine([regex for regex, negate, dir_only in rules if not dir_only])
+            self.dirRegex = self.combine([regex for regex, negate, dir_only in rules])
+
+    def combine(self, regexes):
+        if len(regexes) == 0:
+            return None
+        return re.compile("(?:" + "|".join(regexes) + ")")
+
+    def extend(self, rules):
+        if len(rules) == 0:
+            return self
+        return IgnoreList(self.rules + rules)
+
+    def ignored(self, path, is_dir):
+        if not self.hasNegation:
+            regex = self.dirRegex if is_dir else self.fileRegex
+            return regex is not None and regex.fullmatch(path) is not None
+        
+        for regex, negate, dir_only in reversed(self.compiled):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path):
+                return not negate
+        return False
+
+
+"""
+Files to leave out of the local scan
+.git, patterns from .git/info/exclude and .gitignore files, from the
+git work tree root down, if useGitIgnore, command line exclude globs,
+and, if any include globs are given, files matching none of them.
+As in git, ignore files do not apply to files the repository has,
+those in tracked (CommittedFiles), nor to directories containing them,
+in which only those files are kept.
+Paths passed in are relative to local_dir, which may be below the
+git root, rules are matched against paths relative to the root.
+"""
+class IgnoreRules:
+    def __init__(self, local_dir, excludes=None, includes=None, useGitIgnore=True, tracked=None, verbose=0):
+        self.useGitIgnore = useGitIgnore
+        self.tracked = tracked
+        self.verbose = verbose
+        local_dir = os.path.abspath(local_dir)
+        self.rootDir = self.gitRoot(local_dir)
+        self.prefix = ""                    # local_dir relative to rootDir
+        if self.rootDir is None:
+            self.rootDir = local_dir
+        if local_dir != self.rootDir:
+            self.prefix = os.path.relpath(local_dir, self.rootDir).replace("\\", "/") + "/"
+        
+        rules = [ignoreRule(".git/")]
+        if useGitIgnore:
+            rules += self.readRules(os.path.join(self.rootDir, ".git", "info", "exclude"), "")
+            base_dir = ""
+            dir_path = self.rootDir
+            rules += self.readRules(os.path.join(dir_path, ".gitignore"), base_dir)
+            for name in self.prefix.split("/")[:-1]:
+                base_dir += name + "/"
+                dir_path = os.path.join(dir_path, name)
+                rules += self.readRules(os.path.join(dir_path, ".gitignore"), base_dir)
+        self.rootList = IgnoreList(rules)
+        self.allList = IgnoreList([(".*", False, False)])     # In ignored directories
+        self.excludeList = None
+        if excludes:
+            self.excludeList = IgnoreList([ignoreRule(glob, self.prefix) for glob in excludes])
+        self.includeList = None
+        if includes:
+            self.includeList = IgnoreList([ignoreRule(glob, self.prefix) for glob in includes])
+
+    """
+    Directory containing .git at or above dir_path, None if none
+    """
+    def gitRoot(self, dir_path):
+        while True:
+            if os.path.exists(os.path.join(dir_path, ".git")):
+                return dir_path
+            parent = os.path.dirname(dir_path)
+            if parent == dir_path:
+                return None
+            dir_path = parent
+
+    def readRules(self, ignore_file, base_dir):
+        try:
+            with open(ignore_file, encoding="utf-8", errors="replace") as fin:
+                lines = fin.readlines()
+        except OSError:
+            return []
+        
+        if self.verbose > 0:
+            print("Ignore rules from %s" % ignore_file)
+        rules = []
+        for line in lines:
+            rule = ignoreRule(line, base_dir)
+            if rule is not None:
+                rules.append(rule)
+        return rules
+
+    """
+    Rules for directory dir_path (rpath relative to local_dir)
+    given its parent's rules
+    """
+    def dirList(self, dir_path, rpath, parent_list):
+        if parent_list is self.allList:
+            return parent_list
+        if self.tracked is not None and parent_list.ignored(self.prefix + rpath, True):
+            return self.allList             # Ignored, entered for tracked files
+        if not self.useGitIgnore:
+            return parent_list
+        return parent_list.extend(self.readRules(os.path.join(dir_path, ".gitignore"),
+                                                 self.prefix + rpath + "/"))
+
+    def isIgnored(self, rpath, is_dir, ignore_list):
+        path = self.prefix + rpath
+        if self.excludeList is not None and self.excludeList.ignored(path, is_dir):
+            return True
+        if ignore_list.ignored(path, is_dir) and not self.isTracked(rpath, is_dir):
+            return True
+        if not is_dir and self.includeList is not None:
+            return not self.includeList.ignored(path, False)
+        return False
+
+    """
+    True if the repository has file rpath, or files below directory rpath
+    """
+    def isTracked(self, rpath, is_dir):
+        if self.tracked is None:
+            return False
+        if is_dir:
+            return next(self.tracked.filesUnder(rpath), None) is not None
+        return self.tracked.fileEntry(key=rpath) is not None
+
+
+"""
+Local file scan
+Walks local_dir with os.scandir, one stat per file, and optionally
+hashes the files, on a process pool, using the hash cache to skip unchanged files.
+Files and directories ignored by ignore (IgnoreRules) are left out,
+ignored directories are not entered.
+"""
+class LocalScanner:
+    POOL_MIN_FILES = 64                     # Fewer hashes are done in process
+    
+    def __init__(self, local_dir, hashFiles=False, cache=None, nWorker=None, ignore=None, verbose=0, quiet=False):
+        self.localDir = local_dir
+        self.hashFiles = hashFiles
+        self.ignore = ignore
+        self.nIgnored = 0                   # Files ignored
+        self.nPruned = 0                    # Directories ignored
+        self.cache = cache
+        self.nWorker = nWorker
+        self.verbose = verbose
+        self.quiet = quiet                  # No per directory progress
+        self.nFile = 0
+        self.nByte = 0                      # Bytes hashed
+        self.nHashed = 0
+
+    """
+    Generate LocalFile for every file below localDir
+    Symbolic links to directories are not followed (as os.walk)
+    """
+    def walk(self):
+        ignore = self.ignore
+        ignore_list = None
+        if ignore is not None:
+            ignore_list = ignore.rootList
+        dir_stack = [(self.localDir, "", ignore_list)]
+        while dir_stack:
+            dir_path, dir_rpath, ignore_list = dir_stack.pop()
+            if ignore is not None and dir_rpath != "":
+                ignore_list = ignore.dirList(dir_path, dir_rpath, ignore_list)
+            if not self.quiet:
+                print("Checking files in %s..." % (dir_path))
+            try:
+                dir_entries = list(os.scandir(dir_path))
+            except OSError as e:
+                print("Can't scan %s: %s - ignored" % (dir_path, e))
+                continue
+            sub_dirs = []
+            for entry in dir_entries:
+                rpath = entry.path[len(self.localDir)+1:].replace("\\", "/")
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            if ignore is not None and ignore.isIgnored(rpath, True, ignore_list):
+                                self.nPruned += 1
+                                continue
+                            sub_dirs.append((entry.path, rpath, ignore_list))
+                        continue
+                    if ignore is not None and ignore.isIgnored(rpath, False, ignore_list):
+                        self.nIgnored += 1
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    print("Can't find path %s - ignored" % entry.path)
+                    continue
+                yield LocalFile(entry.path, rpath, stat)
+            sub_dirs.sort(reverse=True)     # Pop in name order
+            dir_stack.extend(sub_dirs)
+
+    """
+    Scan, returning list of LocalFile, hashed if hashFiles
+    """
+    def scan(self):
+        start_time = time.time()
+        local_files = list(self.walk())
+        self.nFile = len(local_files)
+        if self.hashFiles:
+            self.hashAll(local_files, start_time)
+        self.report(time.time() - start_time)
+        return local_files
+
+    def hashAll(self, local_files, scan_time):
+        to_hash = []
+        for local_file in local_files:
+            if self.cache is not None:
+                local_file.sha = self.cache.lookup(local_file)
+            if local_file.sha is None:
+                to_hash.append(local_file)
+        self.nHashed = len(to_hash)
+        self.nByte = sum(local_file.size for local_file in to_hash)
+        paths = [local_file.lpath for local_file in to_hash]
+        sizes = [local_file.size for local_file in to_hash]
+        if len(to_hash) < self.POOL_MIN_FILES:
+            shas = map(hashWorker, paths, sizes)
+            for local_file, sha in zip(to_hash, shas):
+                local_file.sha = sha
+        else:
+            with ProcessPoolExecutor(max_workers=self.nWorker) as executor:
+                chunk_size = max(1, len(to_hash) // (4*(executor._max_workers)))
+                shas = executor.map(hashWorker, paths, sizes, chunksize=chunk_size)
+                for local_file, sha in zip(to_hash, shas):
+                    local_file.sha = sha
+        if self.cache is not None:
+            for local_file in to_hash:
+                self.cache.update(local_file, scan_time)
+            self.cache.save(self.localDir)
+
+    def report(self, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        print("Scanned %d local files in %.2f sec: %.0f files/s" % (self.nFile, elapsed, self.nFile/elapsed))
+        if self.ignore is not None:
+            print("Ignored %d files, skipped %d directories" % (self.nIgnored, self.nPruned))
+        if self.hashFiles:
+            hit_rate = 0.
+            if self.nFile > 0:
+                hit_rate = 100. * (self.nFile - self.nHashed) / self.nFile
+            print("Hashed %d files %.1f MB: %.1f MB/s, cache hit rate %.1f%%"
+                  % (self.nHashed, self.nByte/1e6, self.nByte/1e6/elapsed, hit_rate))
+
+
+"""
+Local file change watchers for --watch
+changes(timeout) waits up to timeout seconds, returning the set of
+paths (relative to local_dir) of files created, changed or removed,
+or None if changes were missed and a full rescan is needed.
+Files and directories ignored by ignore are not reported.
+"""
+
+"""
+Linux inotify, through ctypes, one watch per directory
+"""
+class InotifyWatcher:
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+    EVENT_HEADER = struct.Struct("iIII")        # wd, mask, cookie, name length
+    
+    def __init__(self, local_dir, ignore, verbose=0):
+        import ctypes
+        import ctypes.util
+        self.localDir = local_dir
+        self.ignore = ignore
+        self.verbose = verbose
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "inotify_init1: %s" % os.strerror(errno))
+        self.dirs = {}                      # wd : (dir rpath, ignore list)
+        self.addTree(local_dir, "", ignore.rootList)
+
+    """
+    Watch directory and, recursively, its sub directories
+    Returns paths of files found, for directories created while watching
+    """
+    def addTree(self, dir_path, dir_rpath, ignore_list):
+        files = set()
+        dir_stack = [(dir_path, dir_rpath, ignore_list)]
+        while dir_stack:
+            dir_path, dir_rpath, ignore_list = dir_stack.pop()
+            if dir_rpath != "":
+                ignore_list = self.ignore.dirList(dir_path, dir_rpath, ignore_list)
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.WATCH_MASK)
+            if wd < 0:
+                print("Can't watch %s - ignored" % dir_path)
+                continue
+            self.dirs[wd] = (dir_rpath, ignore_list)
+            try:
+                dir_entries = list(os.scandir(dir_path))
+            except OSError:
+                continue
+            for entry in dir_entries:
+                rpath = self.subPath(dir_rpath, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.ignore.isIgnored(rpath, True, ignore_list):
+                        dir_stack.append((entry.path, rpath, ignore_list))
+                elif not self.ignore.isIgnored(rpath, False, ignore_list):
+                    files.add(rpath)
+        return files
+
+    def subPath(self, dir_rpath, name):
+        if dir_rpath == "":
+            return name
+        return dir_rpath + "/" + name
+
+    def changes(self, timeout):
+        readable, writable, failed = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        
+        buffer = os.read(self.fd, 1024*1024)
+        changed = set()
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, name_len = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset+name_len].rstrip(b"\0"))
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            
+            if mask & self.IN_IGNORED:
+                self.dirs.pop(wd, None)     # Directory removed
+                continue
+            if wd not in self.dirs or name == "":
+                continue
+            dir_rpath, ignore_list = self.dirs[wd]
+            rpath = self.subPath(dir_rpath, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    if not self.ignore.isIgnored(rpath, True, ignore_list):
+                        changed |= self.addTree(os.path.join(self.localDir, rpath), rpath, ignore_list)
+                elif mask & self.IN_MOVED_FROM:
+                    return None             # Files moved away with it
+                continue
+            if not self.ignore.isIgnored(rpath, False, ignore_list):
+                changed.add(rpath)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+"""
+Polling, where there is no inotify: rescan (stat only) every timeout seconds
+"""
+class PollWatcher:
+    def __init__(self, local_dir, ignore, verbose=0):
+        self.localDir = local_dir
+        self.ignore = ignore
+        self.verbose = verbose
+        self.state = self.scan()            # rpath : (mtime ns, size)
+
+    def scan(self):
+        scanner = LocalScanner(self.localDir, ignore=self.ignore, verbose=self.verbose, quiet=True)
+        return {local_file.rpath : (local_file.mtimeNs, local_file.size)
+                for local_file in scanner.walk()}
+
+    def changes(self, timeout):
+        time.sleep(timeout)
+        state = self.scan()
+        changed = set(rpath for rpath in self.state if rpath not in state)
+        for rpath, stamp in state.items():
+            if self.state.get(rpath) != stamp:
+                changed.add(rpath)
+        self.state = state
+        return changed
+
+    def close(self):
+        pass
+
+
+"""
+inotify watcher where available, else polling
+"""
+def localWatcher(local_dir, ignore, poll=False, verbose=0):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(local_dir, ignore, verbose=verbose)
+        except (OSError, AttributeError) as e:
+            print("No inotify (%s) - polling" % e)
+    return PollWatcher(local_dir, ignore, verbose=verbose)
+
+
+"""
+Simple stand in for a ContentFile, from stored file information
+"""
+class FileEntry:
+    def __init__(self, path, type="file", size=0, sha=None):
+        self.path = path
+        self.name = path.split("/")[-1]
+        self.type = type
+        self.size = size
+        self.sha = sha
+
+
+"""
+Commit dates are stored as UTC strings
+"""
+CACHE_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+def dateToCacheStr(date):
+    return date.strftime(CACHE_DATE_FORMAT)
+
+def cacheStrToDate(date_str):
+    return datetime.datetime.strptime(date_str, CACHE_DATE_FORMAT)
+
+
+"""
+First field of a tree manifest (CommittedFiles.saveManifest) header line
+"""
+MANIFEST_HEADER = "#github_files tree"
+
+
+"""
+Response header, PyGithub versions differ in header case
+"""
+def responseHeader(headers, name):
+    if name in headers:
+        return headers[name]
+    return headers.get(name.lower())
+
+
+"""
+Persistent repository metadata cache, kept in an sqlite file
+CommittedFile records are kept by repository and tree sha,
+commit dates by repository, branch and tree sha, the branch's head,
+commit date index and last commit processed by repository and branch.
+API responses are kept with their ETag / Last-Modified so that
+rechecking unchanged data is answered with a 304, which GitHub does not
+count against the rate limit.
+The cache is trimmed, least recently used first, to maxBytes: trees
+and responses, then, as rebuilding them walks the history, branches.
+"""
+class MetaCache:
+    def __init__(self, cache_file, maxBytes=200*1024*1024, refresh=False, verbose=0):
+        self.cacheFile = cache_file
+        self.maxBytes = maxBytes
+        self.refresh = refresh              # Ignore, but update, cached data
+        self.verbose = verbose
+        self.nHit = 0                       # Data found in cache
+        self.nMiss = 0
+        self.nNotModified = 0               # 304 responses
+        self.nRequest = 0
+        self.headMoved = True               # Set by branchHead
+        self.db = sqlite3.connect(cache_file, timeout=60)
+        self.db.executescript(
+            "CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, etag TEXT,"
+            "   last_modified TEXT, link TEXT, body TEXT, used REAL);"
+            "CREATE TABLE IF NOT EXISTS heads (repo TEXT, branch TEXT, head_sha TEXT,"
+            "   tree_sha TEXT, PRIMARY KEY (repo, branch));"
+            "CREATE TABLE IF NOT EXISTS trees (repo TEXT, tree_sha TEXT, nfile INTEGER,"
+            "   used REAL, PRIMARY KEY (repo, tree_sha));"
+            "CREATE TABLE IF NOT EXISTS files (repo TEXT, tree_sha TEXT, path TEXT,"
+            "   type TEXT, size INTEGER, sha TEXT);"
+            "CREATE INDEX IF NOT EXISTS files_tree ON files (repo, tree_sha);"
+            "CREATE TABLE IF NOT EXISTS dates (repo TEXT, branch TEXT, tree_sha TEXT,"
+            "   path TEXT, date TEXT, PRIMARY KEY (repo, branch, tree_sha, path));"
+            "CREATE TABLE IF NOT EXISTS date_index (repo TEXT, branch TEXT, path TEXT,"
+            "   blob_sha TEXT, date TEXT, PRIMARY KEY (repo, branch, path));"
+            "CREATE TABLE IF NOT EXISTS progress (repo TEXT, branch TEXT, commit_sha TEXT,"
+            "   date TEXT, PRIMARY KEY (repo, branch));"
+            "CREATE TABLE IF NOT EXISTS branches (repo TEXT, branch TEXT, used REAL,"
+            "   PRIMARY KEY (repo, branch));")
+
+    """
+    GET url, conditionally if we have a cached response
+    Returns (data, link header), data None if not found
+    """
+    def conditionalGet(self, requester, url):
+        row = None
+        if not self.refresh:
+            row = self.db.execute("SELECT etag, last_modified, link, body FROM responses WHERE url = ?",
+                                  (url,)).fetchone()
+        headers = {}
+        if row is not None:
+            if row[0]:
+                headers["If-None-Match"] = row[0]
+            if row[1]:
+                headers["If-Modified-Since"] = row[1]
+        self.nRequest += 1
+        status, resp_headers, output = requester.requestJson("GET", url, headers=headers)
+        if status == 304 and row is not None:
+            self.nNotModified += 1
+            if self.verbose > 0:
+                print("%s not modified" % url)
+            with self.db:
+                self.db.execute("UPDATE responses SET used = ? WHERE url = ?", (time.time(), url))
+            return json.loads(row[3]), row[2]
+        
+        if status == 404:
+            return None, None
+        if status >= 400:
+            from github import GithubException
+            raise GithubException(status, output)
+        if isinstance(output, bytes):
+            output = output.decode("utf-8")
+        link = responseHeader(resp_headers, "Link")
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (url, responseHeader(resp_headers, "ETag"),
+                             responseHeader(resp_headers, "Last-Modified"),
+                             link, output, time.time()))
+        return json.loads(output), link
+
+    """
+    All pages of a list request
+    """
+    def conditionalGetList(self, requester, url):
+        items = []
+        while url is not None:
+            data, link = self.conditionalGet(requester, url)
+            if data is None:
+                break
+            items.extend(data)
+            url = linkUrl(link, "next")
+        return items
+
+    def branchNames(self, repo):
+        branches = self.conditionalGetList(repo._requester, repo.url + "/branches?per_page=100")
+        return [branch["name"] for branch in branches]
+    
+    """
+    Branch head commit sha and tree sha, (None, None) if no such branch
+    Sets headMoved if the head differs from the last run
     """
-    def collectDir(self, dir_content_file=""):
-        if hasattr(dir_content_file, "name"):            
-            print("%s %s %d %s" %(dir_content_file.name, dir_content_file.type, dir_content_file.size, dir_content_file.path))
-            dir_path = dir_content_file.path
-        else:
-            dir_path = dir_content_file
-            
-        dir_contents = self.repo.get_dir_contents(dir_path)
-        if self.verbose > 0:
-            print("dir_path: %s" % (dir_path))
-                                                        # First process directories, recursively
-        for dir_content_file in dir_contents:
-            if dir_content_file.type == "dir":
-                self.collectDir(dir_content_file)
+    def branchHead(self, repo, branchName):
+        data, link = self.conditionalGet(repo._requester, "%s/branches/%s" % (repo.url, branchName))
+        if data is None:
+            return None, None
+        
+        head_sha = data["commit"]["sha"]
+        tree_sha = data["commit"]["commit"]["tree"]["sha"]
+        row = self.db.execute("SELECT head_sha FROM heads WHERE repo = ? AND branch = ?",
+                              (repo.full_name, branchName)).fetchone()
+        self.headMoved = row is None or row[0] != head_sha
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO heads VALUES (?, ?, ?, ?)",
+                            (repo.full_name, branchName, head_sha, tree_sha))
+            self.db.execute("INSERT OR REPLACE INTO branches VALUES (?, ?, ?)",
+                            (repo.full_name, branchName, time.time()))
+        return head_sha, tree_sha
 
-        for dir_content_file in dir_contents:
-            if dir_content_file.type != "dir":
-                self.collectFile(dir_content_file)
+    """
+    Load committed files for tree, returning True if found
+    """
+    def loadFiles(self, committedFiles, repoName, tree_sha):
+        if self.refresh:
+            return False
+        
+        row = self.db.execute("SELECT nfile FROM trees WHERE repo = ? AND tree_sha = ?",
+                              (repoName, tree_sha)).fetchone()
+        if row is None:
+            self.nMiss += 1
+            return False
+        
+        for path, type, size, sha in self.db.execute(
+                "SELECT path, type, size, sha FROM files WHERE repo = ? AND tree_sha = ?",
+                (repoName, tree_sha)):
+            committedFiles.addFile(FileEntry(path, type, size, sha))
+        self.touchTree(repoName, tree_sha)
+        self.nHit += 1
+        return True
 
-                                  
+    def storeFiles(self, committedFiles, repoName, tree_sha):
+        with self.db:
+            self.db.execute("DELETE FROM files WHERE repo = ? AND tree_sha = ?", (repoName, tree_sha))
+            self.db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                [(repoName, tree_sha, file.filePath, file.fileType, file.fileSize, file.fileSha)
+                                 for file in committedFiles.fileDict.values()])
+            self.db.execute("INSERT OR REPLACE INTO trees VALUES (?, ?, ?, ?)",
+                            (repoName, tree_sha, committedFiles.nFile, time.time()))
+
+    def touchTree(self, repoName, tree_sha):
+        with self.db:
+            self.db.execute("UPDATE trees SET used = ? WHERE repo = ? AND tree_sha = ?",
+                            (time.time(), repoName, tree_sha))
+
+    """
+    Set file dates from cache, returning number dated
+    """
+    def loadDates(self, committedFiles, repoName, branchName, tree_sha):
+        if self.refresh:
+            return 0
         
+        ndated = 0
+        for path, date_str in self.db.execute(
+                "SELECT path, date FROM dates WHERE repo = ? AND branch = ? AND tree_sha = ?",
+                (repoName, branchName, tree_sha)):
+            file = committedFiles.fileEntry(key=path)
+            if file is None or file.date is not None:
+                continue
+            file.date = cacheStrToDate(date_str)
+            committedFiles.nDated += 1
+            ndated += 1
+        return ndated
+
+    def storeDates(self, committedFiles, repoName, branchName, tree_sha):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO dates VALUES (?, ?, ?, ?, ?)",
+                                [(repoName, branchName, tree_sha, file.filePath, dateToCacheStr(file.date))
+                                 for file in committedFiles.fileDict.values() if file.date is not None])
+
+    """
+    Branch's commit date index, of the history up to lastCommit
+    """
+    def loadIndex(self, repoName, branchName):
+        index = CommitDateIndex()
+        if self.refresh:
+            return index
         
+        for path, blob_sha, date_str in self.db.execute(
+                "SELECT path, blob_sha, date FROM date_index WHERE repo = ? AND branch = ?",
+                (repoName, branchName)):
+            index.entries[path] = (cacheStrToDate(date_str) if date_str is not None else None, blob_sha)
+        return index
+
     """
-    """        
-    def getCommitDate(self, fileName):
-        pass
+    Add index, of history newer than that stored, to the stored index
+    """
+    def storeIndex(self, index, repoName, branchName):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO date_index VALUES (?, ?, ?, ?, ?)",
+                                [(repoName, branchName, path, sha, dateToCacheStr(date) if date is not None else None)
+                                 for path, (date, sha) in index.entries.items()])
 
     """
-    Add file to Committed Files
-    """        
+    Newest commit processed for dates: (sha, date), (None, None) if none
+    """
+    def lastCommit(self, repoName, branchName):
+        if self.refresh:
+            return None, None
+        
+        row = self.db.execute("SELECT commit_sha, date FROM progress WHERE repo = ? AND branch = ?",
+                              (repoName, branchName)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], cacheStrToDate(row[1])
 
-    def addFile(self, dir_content_file):
-        cf = CommittedFile(dir_content_file)
-        dict_ent = self.fileEntry(committedFile=cf)
-        if dict_ent:
-            dict_file_name = dict_ent.fileName
-            dict_file_path = dict_ent.filePath
-            print("%s name %s path is already present (%s %s) - ignored" % (cf.fileName, cf.filePath, dict_file_name, dict_file_path))
+    def storeLastCommit(self, repoName, branchName, commit_sha, date):
+        if commit_sha is None:
             return
-        
-        key = cf.filePath    
-        self.fileDict[key] = cf
-        self.nFile += 1
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?)",
+                            (repoName, branchName, commit_sha, dateToCacheStr(date)))
+
+    def usedBytes(self):
+        page_size = self.db.execute("PRAGMA page_size").fetchone()[0]
+        page_count = self.db.execute("PRAGMA page_count").fetchone()[0]
+        free_count = self.db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_count) * page_size
 
     """
-    Return entry if CommittedFile key matches, else None
+    Trim cache to maxBytes, removing least recently used trees
+    and responses, a tenth at a time, then, when there are none left,
+    least recently used branches' heads, date indexes and progress
     """
-    def fileEntry(self, key=None, committedFile=None):
-        if key is not None:
-            if key in self.fileDict:
-                return self.fileDict[key]
-            else:
-                return None
+    def evict(self):
+        if self.usedBytes() <= self.maxBytes:
+            return
         
-        key = committedFile.key    
-        if key in self.fileDict:
-            return self.fileDict[key]
-        else:
-            return None
+        while self.usedBytes() > self.maxBytes:
+            ntree = self.db.execute("SELECT COUNT(*) FROM trees").fetchone()[0]
+            nresp = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if ntree == 0 and nresp == 0:
+                if not self.evictBranches():
+                    break
+                continue
+            with self.db:
+                for repoName, tree_sha in self.db.execute(
+                        "SELECT repo, tree_sha FROM trees ORDER BY used LIMIT ?",
+                        (max(1, ntree // 10),)).fetchall():
+                    if self.verbose > 0:
+                        print("cache: evicting tree %s %s" % (repoName, tree_sha))
+                    self.db.execute("DELETE FROM files WHERE repo = ? AND tree_sha = ?", (repoName, tree_sha))
+                    self.db.execute("DELETE FROM dates WHERE repo = ? AND tree_sha = ?", (repoName, tree_sha))
+                    self.db.execute("DELETE FROM trees WHERE repo = ? AND tree_sha = ?", (repoName, tree_sha))
+                self.db.execute("DELETE FROM responses WHERE url IN"
+                                " (SELECT url FROM responses ORDER BY used LIMIT ?)",
+                                (max(1, nresp // 10),))
+        try:
+            self.db.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            print("cache: VACUUM failed: %s" % e)  # Busy - space is reused anyway
 
+    """
+    Remove a tenth of the branches, least recently used first,
+    returning False if there are none
+    Branches from before branch use was kept count as least recent
+    """
+    def evictBranches(self):
+        branches = self.db.execute(
+            "SELECT repo, branch FROM date_index UNION SELECT repo, branch FROM progress"
+            " UNION SELECT repo, branch FROM heads UNION SELECT repo, branch FROM dates").fetchall()
+        if len(branches) == 0:
+            return False
+        used = dict(((repoName, branchName), used) for repoName, branchName, used
+                    in self.db.execute("SELECT repo, branch, used FROM branches"))
+        branches.sort(key=lambda branch: used.get(branch, 0.))
+        with self.db:
+            for repoName, branchName in branches[:max(1, len(branches) // 10)]:
+                if self.verbose > 0:
+                    print("cache: evicting branch %s %s" % (repoName, branchName))
+                for table in ("date_index", "progress", "heads", "dates", "branches"):
+                    self.db.execute("DELETE FROM %s WHERE repo = ? AND branch = ?" % table,
+                                    (repoName, branchName))
+        return True
+
+    def report(self):
+        print("cache: %d hits %d misses, %d of %d requests not modified"
+              % (self.nHit, self.nMiss, self.nNotModified, self.nRequest))
+        runStats.addCounts("metaCache", hits=self.nHit, misses=self.nMiss,
+                           notModified=self.nNotModified, requests=self.nRequest)
+
+    def close(self):
+        self.evict()
+        self.db.close()
 
-"""
-repo_date to local date string
-"""
-def repoDateToLocalStr(repo_date):
-    repo_time = repo_date.replace(tzinfo=timezone.utc).timestamp()                
-    repo_date_str = datetime.datetime.fromtimestamp(repo_time)
-    return repo_date_str
 
 """
-repo date to local time stamp
+URL with relation rel from a Link header, None if none
 """
-def repoDateToLocalTime(repo_date):
-    repo_time = repo_date.replace(tzinfo=timezone.utc).timestamp()                
-    return repo_time
+def linkUrl(link, rel):
+    if not link:
+        return None
+    for part in link.split(","):
+        match = re.match(r'\s*<([^>]*)>\s*;\s*rel="([^"]*)"', part)
+        if match and match.group(2) == rel:
+            return match.group(1)
+    return None
  
     
 """    
 Commit list from file, base on opts settings
 """
-def commit_files(repo, local_file_dir, news, branch=None):
+def commit_files(repo, local_file_dir, news, branch=None, memBudget=64*1024*1024,
+                 maxBatchEntries=1000, maxBatchBytes=100*1024*1024):
     changed_files = []
     if branch is None:
         branch = "master"
@@ -293,7 +2322,11 @@ def commit_files(repo, local_file_dir, news, branch=None):
         print("No commits")
         return
     
-    commit_list(repo, local_file_dir, changed_files, branchName=branch, commit_message=commit_message)
+    with runStats.phase("commit"):
+        commit = commit_list(repo, local_file_dir, changed_files, branchName=branch, commit_message=commit_message,
+                             memBudget=memBudget, maxBatchEntries=maxBatchEntries, maxBatchBytes=maxBatchBytes)
+    if commit is None:
+        return
     print("Looking at latest commit")
     repo_branch = repo.get_branch(branch)
     commit = repo_branch.commit
@@ -305,47 +2338,353 @@ def commit_files(repo, local_file_dir, news, branch=None):
     print("commit %s %s %s" % (repo_date_str, git_committer.name, comment_str))
     commit_files = commit.files
     for commit_file in commit_files:
-        commit_file_name = commit_file.filename
-        print("    %s" % commit_file_name)
+        reporter.item(0, "commitFile", path=commit_file.filename)
 
 
 """
-Commit list of local files to repository
+Limit on bytes held in memory by concurrent uploads
+A request larger than the whole budget waits until it runs alone.
+"""
+class ByteBudget:
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.used = 0
+        self.peak = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, nbyte):
+        with self.cond:
+            while self.used > 0 and self.used + nbyte > self.maxBytes:
+                self.cond.wait()
+            self.used += nbyte
+            self.peak = max(self.peak, self.used)
+
+    def release(self, nbyte):
+        with self.cond:
+            self.used -= nbyte
+            self.cond.notify_all()
+
+
+"""
+Upload local file, as is, as a blob
+Files up to STREAM_UPLOAD_SIZE are sent from memory, larger files are
+streamed: base64 encoded, a chunk at a time, into a request body file
+which is sent from disk, so memory use doesn't grow with file size.
+budget: ByteBudget shared by concurrent uploads
+Returns (blob sha, file size)
 """
 import base64
-def commit_list(repo, local_file_dir, localFiles, branchName=None, commit_message=None):
+STREAM_UPLOAD_SIZE = 1024*1024
+UPLOAD_CHUNK_SIZE = 3*256*1024              # Multiple of 3: chunks encode independently
+IN_MEMORY_COPIES = 4                        # data, base64, json, request
+
+def uploadBlob(repo, local_file, budget=None):
+    size = os.path.getsize(local_file)
+    stream = size > STREAM_UPLOAD_SIZE
+    cost = 2*UPLOAD_CHUNK_SIZE if stream else IN_MEMORY_COPIES*size
+    if budget is not None:
+        budget.acquire(cost)
+    try:
+        if stream:
+            return streamBlob(repo, local_file), size
+        with open(local_file, 'rb') as input_file:
+            data = input_file.read()
+        blob = repo.create_git_blob(base64.b64encode(data).decode("ascii"), "base64")
+        return blob.sha, len(data)
+    finally:
+        if budget is not None:
+            budget.release(cost)
+
+
+def streamBlob(repo, local_file):
+    body_fd, body_file = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(body_fd, "wb") as fout, open(local_file, "rb") as fin:
+            fout.write(b'{"encoding": "base64", "content": "')
+            while True:
+                chunk = fin.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                fout.write(base64.b64encode(chunk))
+            fout.write(b'"}')
+        headers, data = repo._requester.requestBlobAndCheck(
+            "POST", repo.url + "/git/blobs", headers={"Content-Type" : "application/json"},
+            input=body_file)
+        return data["sha"]
+    finally:
+        try:
+            os.remove(body_file)
+        except OSError as e:
+            print("Can't remove %s: %s" % (body_file, e))
+
+
+"""
+Blob for local file, uploaded only if the content is not already in the repository
+repo_sha: blob sha of the file in the base tree, None if new
+known_shas: all blob shas in the base tree
+Returns (blob sha, file size, "unchanged" | "reused" | "uploaded")
+"""
+def commitBlob(repo, local_file, repo_sha, known_shas, budget=None):
+    size = os.path.getsize(local_file)
+    sha = gitBlobSha(local_file, size)
+    if sha == repo_sha:
+        return sha, size, "unchanged"
+    if sha in known_shas:
+        return sha, size, "reused"
+    blob_sha, size = uploadBlob(repo, local_file, budget)
+    if blob_sha != sha:
+        print("%s changed during upload" % local_file)
+    return blob_sha, size, "uploaded"
+
+
+"""
+Split files into commit batches of at most maxEntries files
+and, unless a single file is larger, maxBytes bytes
+"""
+def commitBatches(localFiles, maxEntries=1000, maxBytes=100*1024*1024):
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for local_file in localFiles:
+        size = os.path.getsize(local_file)
+        if len(batch) > 0 and (len(batch) >= maxEntries or batch_bytes + size > maxBytes):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(local_file)
+        batch_bytes += size
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+
+"""
+Commit list of local files to repository
+Files, text or binary, are uploaded as blobs, nUploader at a time,
+then committed together in one commit.
+Files whose content matches the base tree are left out, content
+already in the base tree is not uploaded again.
+Upload memory is limited to about memBudget bytes.
+Large changesets are uploaded in batches (see commitBatches), each
+batch's tree built on the previous batch's, so no one request is too
+large.  The branch is only updated, with a single commit of the
+final tree, once all batches are done.
+Returns the new commit, None if nothing changed
+"""
+def commit_list(repo, local_file_dir, localFiles, branchName=None, commit_message=None, nUploader=8,
+                memBudget=64*1024*1024, maxBatchEntries=1000, maxBatchBytes=100*1024*1024):
+    from github import InputGitTreeElement
     if branchName is None:
         branchName = 'master'
     if commit_message is None:
         commit_message = input("Commit comment:")
     master_ref = repo.get_git_ref('heads' + "/" + branchName)
     master_sha = master_ref.object.sha
-    base_tree = repo.get_git_tree(master_sha)
-    element_list = list()
-    dir_path_len = len(local_file_dir)
-    for local_file in localFiles:
-        with open(local_file, 'r') as input_file:
-            data = input_file.read()
-        if local_file.endswith('.png'):
-            data = base64.b64encode(data)
-        repo_path = local_file[dir_path_len+1:]
-        element = InputGitTreeElement(repo_path, '100644', 'blob', content=data)
-        element_list.append(element)
-    tree = repo.create_git_tree(element_list, base_tree)
     parent = repo.get_git_commit(master_sha)
+    base_tree = parent.tree
+    base_files = {}                         # path : TreeEntry
+    for entry in TreeLister(repo).entries(base_tree.sha):
+        if entry.type != "dir":
+            base_files[entry.path] = entry
+    known_shas = set(entry.sha for entry in base_files.values())
+    dir_path_len = len(local_file_dir)
+    
+    budget = ByteBudget(memBudget)
+    def commitFileBlob(local_file):
+        repo_path = local_file[dir_path_len+1:].replace("\\", "/")
+        base_file = base_files.get(repo_path)
+        blob_sha, size, how = commitBlob(repo, local_file, base_file.sha if base_file else None,
+                                         known_shas, budget)
+        return repo_path, blob_sha, size, how
+    
+    batches = commitBatches(localFiles, maxEntries=maxBatchEntries, maxBytes=maxBatchBytes)
+    tree = base_tree
+    nchanged = 0
+    nuploaded = nunchanged = nreused = 0
+    nbyte = nsaved = 0
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max(nUploader, 1)) as executor:
+        for nbatch, batch in enumerate(batches):
+            batch_start = time.time()
+            blobs = list(executor.map(commitFileBlob, batch))
+            batch_bytes = 0
+            element_list = list()
+            for repo_path, blob_sha, size, how in blobs:
+                reporter.item(1, "upload", path=repo_path, how=how, size=size, sha=blob_sha)
+                if how == "unchanged":
+                    nunchanged += 1
+                    nsaved += size
+                    continue
+                if how == "reused":
+                    nreused += 1
+                    nsaved += size
+                else:
+                    nuploaded += 1
+                    batch_bytes += size
+                mode = '100644'
+                if repo_path in base_files:
+                    mode = base_files[repo_path].mode       # Keep e.g. executable
+                element = InputGitTreeElement(repo_path, mode, 'blob', sha=blob_sha)
+                element_list.append(element)
+            if len(element_list) > 0:
+                tree = repo.create_git_tree(element_list, tree)
+            nchanged += len(element_list)
+            nbyte += batch_bytes
+            elapsed = max(time.time() - batch_start, 1e-6)
+            print("batch %d of %d: %d files, %d changed, %.1f MB uploaded in %.2f sec: %.1f MB/s"
+                  % (nbatch+1, len(batches), len(batch), len(element_list), batch_bytes/1e6,
+                     elapsed, batch_bytes/1e6/elapsed))
+    elapsed = max(time.time() - start_time, 1e-6)
+    print("%d files %.1f MB uploaded in %.2f sec: %.1f MB/s"
+          % (nuploaded, nbyte/1e6, elapsed, nbyte/1e6/elapsed))
+    print("%d unchanged, %d already in repository: %.1f MB not uploaded"
+          % (nunchanged, nreused, nsaved/1e6))
+    if nbyte > 0:
+        print("Upload memory peak: %.1f MB of %.1f MB budget" % (budget.peak/1e6, memBudget/1e6))
+    if nchanged == 0:
+        print("No changed content - nothing to commit")
+        return None
+    
     commit = repo.create_git_commit(commit_message, tree, [parent])
     master_ref.edit(commit.sha)
-    """ An egregious hack to change the PNG contents after the commit """
-    for local_file in localFiles:
-        if local_file.endswith('.png'):
-            old_file = repo.get_contents(local_file)
-            with open(local_file, 'rb') as input_file:
-                data = input_file.read()
-                commit = repo.update_file('/' + local_file, 'Update PNG content', data, old_file.sha)
+    reporter.item(0, "committed", sha=commit.sha, count=nchanged, branch=branchName)
+    return commit
+
+
+"""
+Pull: bring local files up to date with the repository
+Download blob to lpath: decoded a chunk at a time into a temporary
+file beside lpath, checked against the blob's git sha, then renamed
+into place, so lpath is never left partly written.
+The blob API returns the whole (base64) blob, so memory is taken
+from budget, as for uploads.
+mode: permissions for lpath (temporary files are private)
+Returns bytes written
+"""
+def downloadBlob(repo, committed_file, lpath, mode=0o644, budget=None):
+    cost = IN_MEMORY_COPIES*committed_file.fileSize
+    if budget is not None:
+        budget.acquire(cost)
+    try:
+        blob = repo.get_git_blob(committed_file.fileSha)
+        if blob.encoding == "base64":
+            content = blob.content.replace("\n", "")
+            chunks = (base64.b64decode(content[start:start+4*UPLOAD_CHUNK_SIZE//3])
+                      for start in range(0, len(content), 4*UPLOAD_CHUNK_SIZE//3))
+        else:
+            chunks = [blob.content.encode("utf-8")]
+        dir_path = os.path.dirname(lpath)
+        os.makedirs(dir_path, exist_ok=True)
+        temp_fd, temp_file = tempfile.mkstemp(dir=dir_path, prefix=".pull_", suffix=".tmp")
+        try:
+            hasher = hashlib.sha1(b"blob %d\0" % blob.size)
+            nbyte = 0
+            with os.fdopen(temp_fd, "wb") as fout:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    fout.write(chunk)
+                    nbyte += len(chunk)
+            if nbyte != blob.size or hasher.hexdigest() != committed_file.fileSha:
+                raise Exception("%s: downloaded content does not match blob %s"
+                                % (committed_file.filePath, committed_file.fileSha))
+            os.chmod(temp_file, mode)
+            os.replace(temp_file, lpath)
+        except BaseException:
+            os.remove(temp_file)
+            raise
+        return nbyte
+    finally:
+        if budget is not None:
+            budget.release(cost)
+
+
+"""
+Pull repository branch into local_file_dir: download files missing
+locally or whose content (git blob sha) differs, after confirmation.
+Local files not in the repository are left alone.
+Returns number of files pulled, None if the branch doesn't exist
+"""
+def pull_repo(gH, repo_name, branch_name, local_file_dir, opts, nDownloader=8,
+              memBudget=64*1024*1024):
+    print("repository: %s" % repo_name)
+    repo = get_repository(gH, repo_name)
+    cF, branch_name = branch_files(repo, branch_name, opts)
+    if cF is None:
+        return None
+    
+    print("Local files: %s" % local_file_dir)
+    hash_cache = None
+    if opts.hashCache != "none":
+        hash_cache = HashCache(opts.hashCache, verbose=opts.verbose)
+    ignore = IgnoreRules(local_file_dir, excludes=opts.excludes, includes=opts.includes,
+                         useGitIgnore=not opts.noIgnore, tracked=cF, verbose=opts.verbose)
+    scanner = LocalScanner(local_file_dir, hashFiles=True, cache=hash_cache, ignore=ignore,
+                           nWorker=opts.workers, verbose=opts.verbose)
+    with runStats.phase("local"):
+        local_shas = {local_file.rpath : local_file.sha for local_file in scanner.scan()}
+    if hash_cache is not None:
+        hash_cache.close()
+    
+    to_pull = []                            # (CommittedFile, local path, is new)
+    nskipped = 0
+    for file in cF.filesUnder(""):
+        if file.fileType != "file":
+            if file.fileType == "symlink":
+                print("%s is a symbolic link - not pulled" % file.filePath)
+            continue
+        if file.filePath.startswith("/") or ".." in file.filePath.split("/"):
+            print("%s is outside the local directory - not pulled" % file.filePath)
+            continue
+        lpath = os.path.join(local_file_dir, *file.filePath.split("/"))
+        local_sha = local_shas.get(file.filePath)
+        if local_sha is None and os.path.isfile(lpath):
+            local_sha = gitBlobSha(lpath)   # Excluded locally, but in the repository
+        if local_sha == file.fileSha:
+            nskipped += 1
+            continue
+        to_pull.append((file, lpath, local_sha is None))
+    print("%d files up to date, %d to pull" % (nskipped, len(to_pull)))
+    if len(to_pull) == 0:
+        return 0
+    
+    for file, lpath, is_new in to_pull:
+        print("    %s %s" % ("new    " if is_new else "replace", file.filePath))
+    if input("Enter 'y' to pull new and changed files:") != 'y':
+        print("No files pulled")
+        return 0
+    
+    umask = os.umask(0)
+    os.umask(umask)
+    budget = ByteBudget(memBudget)
+    def pullFile(pull_entry):
+        file, lpath, is_new = pull_entry
+        try:
+            mode = 0o666 & ~umask
+            if not is_new:
+                mode = os.stat(lpath).st_mode & 0o7777     # Keep e.g. executable
+            return downloadBlob(repo, file, lpath, mode, budget)
+        except Exception as e:
+            print("%s: pull failed: %s" % (file.filePath, e))
+            return None
+    
+    start_time = time.time()
+    with runStats.phase("download"), ThreadPoolExecutor(max_workers=max(nDownloader, 1)) as executor:
+        results = list(executor.map(pullFile, to_pull))
+    elapsed = max(time.time() - start_time, 1e-6)
+    npulled = len([nbyte for nbyte in results if nbyte is not None])
+    nbyte = sum(nbyte for nbyte in results if nbyte is not None)
+    print("%d files %.1f MB pulled in %.2f sec: %.1f files/s %.1f MB/s, %d failed"
+          % (npulled, nbyte/1e6, elapsed, npulled/elapsed, nbyte/1e6/elapsed, len(to_pull) - npulled))
+    print("Download memory peak: %.1f MB of %.1f MB budget" % (budget.peak/1e6, memBudget/1e6))
+    return npulled
 
 """
 =================================================================================================================
 Support for detailed scan of repository
+Every commit, with its files and comments, is written as a JSON line
+to the scan report: {"sha", "date", "committer", "message",
+"files": [{"filename", "status", "previous_filename", ...}],
+"comments": [{"body", "user", "created_at"}]}
 """
                 
                 
@@ -354,27 +2693,29 @@ def process_file(repo, dir_content_file):
                         
 """
 Process directory
+dir_content_file: directory ContentFile, else branch name
+Listed from the git tree rather than directory by directory
 """
-def process_dir(repo, dir_content_file):
+def process_dir(repo, dir_content_file="master"):
     if hasattr(dir_content_file, "name"):            
         print("%s %s %d %s" %(dir_content_file.name, dir_content_file.type, dir_content_file.size, dir_content_file.path))
         dir_path = dir_content_file.path
+        tree_sha = dir_content_file.sha         # Directory sha is its tree sha
     else:
-        dir_path = dir_content_file
+        dir_path = ""
+        tree_sha = dir_content_file
         
-    dir_contents = repo.get_dir_contents(dir_path)
     print("dir_path: %s" % (dir_path))
-                                                    # First process directories
-    for dir_content_file in dir_contents:
-        if dir_content_file.type == "dir":
-            process_dir(repo, dir_content_file)
-
-    for dir_content_file in dir_contents:
-        if dir_content_file.type != "dir":
-            process_file(repo, dir_content_file)
+    lister = TreeLister(repo)
+    for entry in lister.entries(tree_sha, dir_path):
+        if entry.type == "dir":
+            print("dir_path: %s" % (entry.path))
+        else:
+            process_file(repo, entry)
+    print("%d API calls" % lister.nApiCall)
 
                                   
-def detailed_scan(repo):
+def detailed_scan(repo, report_file="detailed_scan.jsonl", nFetcher=8, verbose=0):
     repod = obj_desc(repo)
     repod.desc("name")
     repod.desc("git_url")
@@ -392,36 +2733,527 @@ def detailed_scan(repo):
     
     repo_url = repo.url;
     print("\nrepo.url: %s" % repo_url)
-        
+    
+    done = loadScanReport(report_file)
+    if len(done) > 0:
+        print("%d commits already in %s - skipped" % (len(done), report_file))
     commits = repo.get_commits()
-    ncommit = 0
-    for commit in commits:
-        ncommit += 1
-    print("%d commits" % ncommit)
+    commit_stream = PageStream(commits, verbose=verbose)
+    to_scan = (commit for commit in commit_stream if commit.sha not in done)
+    fetcher = CommitDetailFetcher(to_scan, nWorker=nFetcher, fetch=fetchCommitDetail, verbose=verbose)
     nshow = 0
-    for commit in commits:
-        nshow += 1
+    start_time = time.time()
+    try:
+        with open(report_file, "a", encoding="utf-8") as fout:
+            for commit, (commit_files, comments) in fetcher:
+                nshow += 1
+                record = commitRecord(commit, commit_files, comments)
+                fout.write(json.dumps(record) + "\n")
+                if verbose > 0:
+                    print("commit %d: %s %s files: %s" % (nshow, record["date"], record["sha"],
+                                                         ", ".join(file["filename"] for file in record["files"])))
+                if verbose > 1:
+                    cod = obj_desc(commit, "commit %d" % nshow)
+                    cod.descs("author", "comments_url", "commit", "committer", "tree", "url")
+                if nshow % 100 == 0:
+                    fout.flush()
+                    print("%d commits scanned, %.1f commits/s" % (nshow, nshow/max(time.time() - start_time, 1e-6)))
+    except KeyboardInterrupt:
+        print("Scan interrupted - run again to resume")
+    finally:
+        fetcher.close()
+        commit_stream.close()
+    print("%d commits scanned in %.2f sec, %d listed in %d pages, report in %s"
+          % (nshow, time.time() - start_time, commit_stream.nItem, commit_stream.nPage,
+             os.path.abspath(report_file)))
+
+
+"""
+Files, and comments if there are any, of commit
+Two requests at most, one if the commit has no comments
+"""
+def fetchCommitDetail(commit):
+    commit_files = commit.files
+    comment_count = commit._rawData.get("commit", {}).get("comment_count")  # Without completion
+    comments = []
+    if comment_count is None or comment_count > 0:
+        comments = list(commit.get_comments())
+    return commit_files, comments
+
+
+"""
+Detailed scan report record for commit
+"""
+def commitRecord(commit, commit_files, comments):
+    git_commit = commit.commit
+    git_committer = git_commit.committer
+    files = []
+    for file in commit_files:
+        files.append(dict(filename=file.filename, status=file.status, previous_filename=file.previous_filename,
+                          sha=file.sha, additions=file.additions, deletions=file.deletions,
+                          changes=file.changes))
+    return dict(sha=commit.sha, date=dateToCacheStr(git_committer.date), committer=git_committer.name,
+                message=git_commit.message, files=files,
+                comments=[dict(body=comment.body, user=comment.user.login if comment.user else None,
+                               created_at=dateToCacheStr(comment.created_at))
+                          for comment in comments])
+
+
+"""
+shas of commits in detailed scan report, empty if there is no report
+An incomplete last record, from an interrupted scan, is removed
+"""
+def loadScanReport(report_file):
+    done = set()
+    if not os.path.exists(report_file):
+        return done
+    
+    good_end = 0
+    with open(report_file, "rb") as fin:
+        for line in fin:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            done.add(record["sha"])
+            good_end += len(line)
+    if good_end < os.path.getsize(report_file):
+        print("Removing incomplete end of %s" % report_file)
+        with open(report_file, "r+b") as fout:
+            fout.truncate(good_end)
+    return done
+
+"""
+=================================================================================================================
+Scanning a repository and its local files
+"""
+
+
+"""
+Local file directory for repository: <local root>/<repo>,
+or its "src" sub directory if there is one
+"""
+def local_dir(local_root, repo_name):
+    local_files_spec = os.path.join(local_root, repo_name.split("/")[-1])
+    local_file_dir = os.path.abspath(local_files_spec)
+    lsrc = os.path.join(local_file_dir, "src")
+    if os.path.exists(lsrc) and os.path.isdir(lsrc):
+        local_file_dir = lsrc
+        print("Using \"src\" sub directory for files")
+    return local_file_dir
+
+
+"""
+Committed files of branch, with commit dates unless opts.hashCompare
+Uses, and updates, meta_cache if not None
+"""
+def remote_files(repo, branch_name, tree_sha, opts, meta_cache=None):
+    cF = CommittedFiles(repo, branchName=branch_name, verbose=opts.verbose, nFetcher=opts.fetchers)
+    with runStats.phase("list"):
+        if meta_cache is not None and meta_cache.loadFiles(cF, repo.full_name, tree_sha):
+            print("%d files from cache" % cF.nFile)
+        else:
+            cF.collectTree(tree_sha)
+            if meta_cache is not None:
+                meta_cache.storeFiles(cF, repo.full_name, tree_sha)
+    if opts.hashCompare:
+        print("Comparing file contents - no commit dates needed")
+        return cF
+    
+    with runStats.phase("dates"):
+        if meta_cache is not None:
+            meta_cache.loadDates(cF, repo.full_name, branch_name, tree_sha)
+        if cF.nDated < cF.nFile:
+            stop_sha = since = None
+            stored_index = None
+            if meta_cache is not None:
+                stored_index = meta_cache.loadIndex(repo.full_name, branch_name)
+                ndated = cF.applyIndex(stored_index)
+                print("%d files with unchanged content dated from cache" % ndated)
+                stop_sha, since = meta_cache.lastCommit(repo.full_name, branch_name)
+            if cF.nFile - cF.nDated > opts.pathQueries:  # Else path queries are cheaper
+                cF.collectCommitDates(stopSha=stop_sha, since=since, maxUndated=opts.pathQueries)
+            if cF.nDated < cF.nFile:
+                cF.collectPathDates()
+            if meta_cache is not None:
+                meta_cache.storeDates(cF, repo.full_name, branch_name, tree_sha)
+                meta_cache.storeIndex(cF.dateIndex, repo.full_name, branch_name)
+                meta_cache.storeLastCommit(repo.full_name, branch_name, cF.headSha, cF.headDate)
+                cF.dateIndex.update(stored_index)
+    cF.listUndated()
+    print("%d files of %d have commit dates" % (cF.nDated, cF.nFile))
+    return cF
+
+
+"""
+Scan local files, checking for updates
+Returns (list of new or changed local file paths, number of local files)
+"""
+def changed_local_files(cF, local_file_dir, opts):
+    changed_files = []
+    hash_cache = None
+    if opts.hashCompare and opts.hashCache != "none":
+        hash_cache = HashCache(opts.hashCache, verbose=opts.verbose)
+    ignore = IgnoreRules(local_file_dir, excludes=opts.excludes, includes=opts.includes,
+                         useGitIgnore=not opts.noIgnore, tracked=cF, verbose=opts.verbose)
+    scanner = LocalScanner(local_file_dir, hashFiles=opts.hashCompare, cache=hash_cache, ignore=ignore,
+                           nWorker=opts.workers, verbose=opts.verbose)
+    with runStats.phase("local"):
+        local_files = scanner.scan()
+    for local_file in local_files:
+        if local_file_changed(cF, local_file, opts):
+            changed_files.append(local_file.lpath)     # Add to list
+    if hash_cache is not None:
+        hash_cache.close()
+    return changed_files, scanner.nFile
+
+
+"""
+Check if local file is new or changed compared to the repository
+local_file.sha must be set if opts.hashCompare
+"""
+def local_file_changed(cF, local_file, opts):
+    rpath = local_file.rpath
+    fentry = cF.fileEntry(key=rpath)
+    if (not fentry):
+        reporter.item(0, "new", path=rpath)
+        return True
+
+    if opts.hashCompare:
+        lsha = local_file.sha
+        reporter.item(1, "hashCompare", path=rpath, sha=lsha, repoSha=fentry.fileSha)
+        if lsha != fentry.fileSha:
+            reporter.item(0, "differs", path=rpath)
+            return True
+        return False
+    
+    repo_date = fentry.date
+    if repo_date is None:                           # No commit date to compare with
+        lsha = local_file.sha
+        if lsha is None:
+            lsha = gitBlobSha(local_file.lpath)
+        if lsha != fentry.fileSha:
+            reporter.item(0, "undatedDiffers", path=rpath)
+            return True
+        return False
+    
+    repo_time = repoDateToLocalTime(repo_date)
+    ltime = local_file.mtime
+    reporter.item(1, "compare", path=rpath, localTime=ltime, repoTime=repo_time)
+    #lfile = datetime.datetime.strptime(linx_file_dtime[:-3], '%Y-%m-%d_%H:%M:%S.%f')
+    if ltime > repo_time:
+        reporter.item(0, "newer", path=rpath, localTime=ltime, repoTime=repo_time)
+        return True
+    return False
+
+
+"""
+Keep the changed file list, newfile, current as local files change,
+until interrupted.  cF, the repository's files, is kept as scanned,
+changed_files is the list from the scan.
+Only the changed paths are checked, by inotify where available
+else by polling every opts.watchPoll seconds.
+"""
+def watch_changes(cF, local_file_dir, changed_files, opts, newfile):
+    ignore = IgnoreRules(local_file_dir, excludes=opts.excludes, includes=opts.includes,
+                         useGitIgnore=not opts.noIgnore, tracked=cF, verbose=opts.verbose)
+    watcher = localWatcher(local_file_dir, ignore, poll=opts.watchPoll > 0, verbose=opts.verbose)
+    timeout = opts.watchPoll if opts.watchPoll > 0 else 1.0
+    changed = {}                                    # rpath : lpath
+    for lpath in changed_files:
+        changed[lpath[len(local_file_dir)+1:].replace("\\", "/")] = lpath
+    write_changed_list(list(changed.values()), newfile)
+    print("Watching %s (%s), %d changed files - Ctrl-C to stop"
+          % (local_file_dir, watcher.__class__.__name__, len(changed)))
+    try:
+        while True:
+            touched = watcher.changes(timeout)
+            if touched is None:
+                print("Changes missed - rescanning")
+                rescanned, nlocal = changed_local_files(cF, local_file_dir, opts)
+                changed = {}
+                for lpath in rescanned:
+                    changed[lpath[len(local_file_dir)+1:].replace("\\", "/")] = lpath
+                write_changed_list(list(changed.values()), newfile)
+                reporter.flush()
+                continue
+            
+            while touched:                          # Let bursts (saves) settle
+                more = watcher.changes(.2)
+                if not more:
+                    break
+                touched |= more
+            nchanged = len(changed)
+            update = False
+            for rpath in sorted(touched):
+                lpath = os.path.join(local_file_dir, rpath)
+                try:
+                    local_file = LocalFile(lpath, rpath, os.stat(lpath))
+                    if opts.hashCompare:
+                        local_file.sha = gitBlobSha(lpath, local_file.size)
+                except OSError:
+                    local_file = None               # Removed
+                if local_file is not None and local_file_changed(cF, local_file, opts):
+                    update = update or rpath not in changed
+                    changed[rpath] = lpath
+                elif rpath in changed:
+                    del changed[rpath]
+                    update = True
+            reporter.flush()
+            if update:
+                write_changed_list(list(changed.values()), newfile)
+                print("%d changed files (was %d)" % (len(changed), nchanged))
+    except KeyboardInterrupt:
+        print("Watch stopped")
+    finally:
+        watcher.close()
+
+
+"""
+Repository by name: "owner/name", or the name of one of the
+authenticated user's repositories, which first fetches the user
+"""
+def get_repository(gH, repo_name):
+    if "/" in repo_name:
+        return gH.get_repo(repo_name)
+    return gH.get_user().get_repo(repo_name)
+
+
+"""
+Branch head commit sha and tree sha, from the one branch request,
+(None, None) if no such branch
+"""
+def branch_head(repo, branch_name):
+    from github import GithubException
+    try:
+        branch = repo.get_branch(branch_name)
+    except GithubException as e:
+        if e.status == 404:
+            return None, None
+        raise
+    commit = branch._rawData["commit"]
+    return commit["sha"], commit["commit"]["tree"]["sha"]
+
+
+"""
+Committed files of repository branch, using the metadata cache unless opts.noCache
+The branch is checked by its head (a request, or a not modified response
+with the cache), the branch list is only fetched to report a missing branch
+branch_name: None - repository's default branch
+Returns (CommittedFiles, branch name), CommittedFiles None if there is no such branch
+"""
+def branch_files(repo, branch_name, opts):
+    meta_cache = None
+    if not opts.noCache:
+        meta_cache = MetaCache(opts.cacheFile, maxBytes=opts.cacheSize*1024*1024,
+                               refresh=opts.refresh, verbose=opts.verbose)
+    if branch_name is None:
+        branch_name = repo.default_branch
+        print("default branch: %s" % branch_name)
+    reporter.scan(repo.full_name, branch_name)
+    if meta_cache is not None:
+        head_sha, tree_sha = meta_cache.branchHead(repo, branch_name)
+    else:
+        head_sha, tree_sha = branch_head(repo, branch_name)
+    if head_sha is None:
+        if meta_cache is not None:
+            branch_names = meta_cache.branchNames(repo)
+        else:
+            branch_names = [branch.name for branch in repo.get_branches()]
+        print("branch name: %s is not in your branches: %s" % (branch_name, ", ".join(branch_names)))
+        if meta_cache is not None:
+            meta_cache.close()
+        return None, branch_name
         
-        cod = obj_desc(commit)
-        print("\ncommit %d" % nshow)
-        cod.descs("author", "comments_url", "commit", "committer", "tree", "url")
-        git_commit = commit.commit
-        gcod = obj_desc(git_commit)
-        gcod.descs("message", "author", "tree", "url")
-        files_str = ""
-        for file in commit.files:
-            print("")
-            fid = obj_desc(file)
-            fid.descs("filename", "status", "previous_filename", "contents_url", "raw_url", "additions", "changes")
-            if (files_str != ""):
-                files_str += ", "
-            files_str += file.filename
-        print("files: %s" % files_str)
+    print("Using branch: %s" % branch_name)
+    if meta_cache is not None:
+        if not meta_cache.headMoved:
+            print("branch %s head %s unchanged since last run" % (branch_name, head_sha))
+    cF = remote_files(repo, branch_name, tree_sha, opts, meta_cache)
+    if meta_cache is not None:
+        meta_cache.report()
+        meta_cache.close()
+    return cF, branch_name
+
+
+"""
+Scan repository branch against local_file_dir, writing the list of
+new and changed files to newfile
+branch_name: None - repository's default branch
+manifest_file: if not None, save the repository's files as a tree manifest
+Returns summary dictionary, "error" set if the scan could not be done
+"""
+def scan_repo(gH, repo_name, branch_name, local_file_dir, opts, newfile, manifest_file=None):
+    start_time = time.time()
+    summary = dict(repo=repo_name, branch=branch_name, localDir=local_file_dir, files=0, dated=0,
+                   local=0, changed=0, changedList=None, seconds=0., error=None, repository=None,
+                   committedFiles=None, changedFiles=None)
+    print("repository: %s" % repo_name)
+    repo = get_repository(gH, repo_name)
+    summary["repository"] = repo
+    print("Got repo[%s]" % repo.full_name)
+    cF, branch_name = branch_files(repo, branch_name, opts)
+    summary["branch"] = branch_name
+    if cF is None:
+        summary["error"] = "no branch %s" % branch_name
+        return summary
         
-        commit_comments = commit.get_comments()
-        for comment in commit_comments:
-            ccd = obj_desc(comment)
-            ccd.descs("body", "commit_id", "created_at")  
+    print("Local files: %s" % local_file_dir)
+    if opts.fullScan:
+        report_file = opts.scanReport
+        if not report_file:
+            report_file = os.path.join("..", repo.full_name.replace("/", "_") + ".scan.jsonl")
+        with runStats.phase("detailed scan"):
+            detailed_scan(repo, report_file, nFetcher=opts.fetchers, verbose=opts.verbose)
+    if manifest_file is not None:
+        cF.saveManifest(manifest_file, repo.full_name)
+    summary["files"] = cF.nFile
+    summary["dated"] = cF.nDated
+    
+    changed_files, summary["local"] = changed_local_files(cF, local_file_dir, opts)
+    summary["changed"] = len(changed_files)
+    if len(changed_files) > 0:
+        summary["changedList"] = write_changed_list(changed_files, newfile)
+    summary["seconds"] = time.time() - start_time
+    summary["committedFiles"] = cF
+    summary["changedFiles"] = changed_files
+    return summary
+
+
+"""
+Write list of changed files, returning the list's full path
+"""
+def write_changed_list(changed_files, newfile):
+    commit_list_file = os.path.abspath(newfile)
+    print("Changed file list is in %s" % commit_list_file)
+    fout = open(commit_list_file + ".tmp", 'w')
+    out_str = "\n".join(changed_files)
+    fout.write(out_str)
+    fout.close()
+    os.replace(commit_list_file + ".tmp", commit_list_file)     # Readers never see part of a list
+    return commit_list_file
+
+
+"""
+Compare local files against a saved tree manifest, no GitHub access
+Writes the list of new and changed files to newfile, but never commits
+Returns the number of new and changed files
+"""
+def offline_diff(manifest_file, local_root, repo_name, opts, newfile):
+    cF = CommittedFiles(None, verbose=opts.verbose)
+    manifest_repo = cF.loadManifest(manifest_file)
+    if repo_name is None:
+        repo_name = manifest_repo.split("/")[-1]
+    local_file_dir = local_dir(local_root, repo_name)
+    print("Local files: %s" % local_file_dir)
+    if not os.path.isdir(local_file_dir):
+        raise Exception("No local directory %s for %s" % (local_file_dir, manifest_repo))
+    reporter.scan(manifest_repo, cF.branchName)
+    if not opts.hashCompare:
+        cF.listUndated()
+        print("%d files of %d have commit dates" % (cF.nDated, cF.nFile))
+    changed_files, nlocal = changed_local_files(cF, local_file_dir, opts)
+    if len(changed_files) > 0:
+        write_changed_list(changed_files, newfile)
+    else:
+        print("No new or changed files")
+    return len(changed_files)
+
+
+"""
+Read manifest of repositories to sync
+One entry per line: repository [branch [local directory]]
+branch "-" or missing: default_branch, else the repository's default
+local directory missing: as for --local
+"#" starts a comment
+A repository and branch may be listed only once
+"""
+def read_manifest(manifest_file, default_branch, local_root):
+    entries = []
+    seen = {}                               # (repository, branch) : line number
+    with open(manifest_file) as fin:
+        for line_number, line in enumerate(fin, 1):
+            line = line.split("#")[0].strip()
+            if line == "":
+                continue
+            fields = line.split(None, 2)
+            repo_name = fields[0]
+            branch_name = default_branch
+            if len(fields) > 1 and fields[1] != "-":
+                branch_name = fields[1]
+            if len(fields) > 2:
+                local_file_dir = os.path.abspath(fields[2])
+            else:
+                local_file_dir = local_dir(local_root, repo_name)
+            if (repo_name, branch_name) in seen:
+                raise Exception("%s line %d: %s branch %s is already on line %d"
+                                % (manifest_file, line_number, repo_name,
+                                   branch_name if branch_name is not None else "(default)",
+                                   seen[(repo_name, branch_name)]))
+            seen[(repo_name, branch_name)] = line_number
+            entries.append((repo_name, branch_name, local_file_dir))
+    return entries
+
+
+"""
+File name, for a manifest entry's output, from repository and branch:
+<owner>_<repo>@<branch><suffix>, "/" in either replaced by "_"
+"""
+def entry_file_name(repo_name, branch_name, suffix):
+    if branch_name is None:
+        branch_name = "default"
+    return "%s@%s%s" % (repo_name.replace("/", "_"), branch_name.replace("/", "_"), suffix)
+
+
+"""
+Scan all manifest entries, opts.jobs at a time, sharing gH's
+session and so its request scheduler (concurrency and rate limit).
+Each entry's changed file list goes to <repo>@<branch>.commits beside
+opts.newfile.  A summary is printed, and written as JSON to opts.report
+Tree manifests, with --savetree, go to <repo>@<branch>.tree beside opts.saveTree
+"""
+def sync_manifest(gH, entries, opts):
+    news_dir = os.path.dirname(opts.newfile)
+    
+    def sync_entry(entry):
+        repo_name, branch_name, local_file_dir = entry
+        newfile = os.path.join(news_dir, entry_file_name(repo_name, branch_name, ".commits"))
+        manifest_file = None
+        if opts.saveTree:
+            manifest_file = os.path.join(os.path.dirname(opts.saveTree),
+                                         entry_file_name(repo_name, branch_name, ".tree"))
+        start_time = time.time()
+        try:
+            return scan_repo(gH, repo_name, branch_name, local_file_dir, opts, newfile, manifest_file)
+        except Exception as e:
+            print("%s: %s" % (repo_name, repr(e)))
+            return dict(repo=repo_name, branch=branch_name, localDir=local_file_dir, files=0, dated=0,
+                        local=0, changed=0, changedList=None, seconds=time.time() - start_time,
+                        error=repr(e), repository=None, committedFiles=None, changedFiles=None)
+    
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max(opts.jobs, 1)) as executor:
+        summaries = list(executor.map(sync_entry, entries))
+    elapsed = time.time() - start_time
+    for summary in summaries:
+        del summary["repository"], summary["committedFiles"], summary["changedFiles"]
+    
+    print("\n%-30s %-15s %7s %7s %7s %7s %8s" % ("repository", "branch", "files", "dated", "local", "changed", "seconds"))
+    for summary in summaries:
+        print("%-30s %-15s %7d %7d %7d %7d %8.2f%s"
+              % (summary["repo"], summary["branch"], summary["files"], summary["dated"],
+                 summary["local"], summary["changed"], summary["seconds"],
+                 "" if summary["error"] is None else "  " + summary["error"]))
+    nerror = len([summary for summary in summaries if summary["error"] is not None])
+    print("%d repositories in %.2f sec, %d with errors" % (len(summaries), elapsed, nerror))
+    if opts.report:
+        with open(opts.report, "w") as fout:
+            json.dump(dict(seconds=elapsed, repositories=summaries), fout, indent=2)
+        print("Summary report is in %s" % os.path.abspath(opts.report))
+    return summaries
+
 
 """
 =================================================================================================================
@@ -444,185 +3276,235 @@ def main(argv=None):
 
     if argv is None:
         argv = sys.argv[1:]
+    stats_json = None
     try:
         # setup option parser
         parser = OptionParser(version=program_version_string, epilog=program_longdesc, description=program_license)
         parser.add_option("-a", "--all", dest="all", help="include all files [default: None]")
-        parser.add_option("-b", "--branch", dest="branch", help="branch name [default: %default]")
+        parser.add_option("-b", "--branch", dest="branch",
+                          help="branch name [default: master, with --manifest the repository's default]")
+        parser.add_option(      "--baseurl", dest="baseUrl", help="GitHub API URL [default: %default]")
+        parser.add_option(      "--batchfiles", dest="batchFiles", type="int",
+                          help="maximum files per commit batch [default: %default]")
+        parser.add_option(      "--batchmb", dest="batchMb", type="int",
+                          help="maximum MB per commit batch [default: %default]")
+        parser.add_option(      "--cache", dest="cacheFile", help="repository metadata cache file [default: parent dir]")
+        parser.add_option(      "--cachesize", dest="cacheSize", type="int", help="metadata cache size limit, MB [default: %default]")
+        parser.add_option(      "--no-cache", dest="noCache", action="store_true", default=False,
+                          help="don't use the metadata cache [default: %default]")
+        parser.add_option(      "--refresh", dest="refresh", action="store_true", default=False,
+                          help="refetch, ignoring cached metadata, and update the cache [default: %default]")
         parser.add_option("-c", "--commlast", dest="commlast", help="just last commits[default: %default], metavar='COMMITS'")
         parser.add_option(      "--commit", dest="commit", action="store_true", default=False, help="just commit[default: None]")
+        parser.add_option(      "--fetchers", dest="fetchers", type="int",
+                          help="concurrent commit detail requests [default: %default]")
+        parser.add_option(      "--descjson", dest="descJson",
+                          help="also write verbose object descriptions as JSON lines to file [default: None]")
+        parser.add_option(      "--downloads", dest="downloads", type="int",
+                          help="concurrent downloads with --pull [default: %default]")
+        parser.add_option(      "--exclude", dest="excludes", action="append",
+                          help="leave out local files matching gitignore style glob, may be repeated [default: None]")
+        parser.add_option(      "--format", dest="outFormat", choices=Reporter.FORMATS,
+                          help="--out report format: %s [default: %%default]" % ", ".join(Reporter.FORMATS))
         parser.add_option("-f", "--fullscan", dest="fullScan", help="do full scan[default: %default]")
+        parser.add_option(      "--scanreport", dest="scanReport",
+                          help="full scan report (JSON lines) file, resumed if present [default: parent dir/<repo>.scan.jsonl]")
+        parser.add_option(      "--hash", dest="hashCompare", action="store_true", default=False,
+                          help="detect changes by comparing file content (git blob sha), no commit dates needed[default: %default]")
+        parser.add_option(      "--hashcache", dest="hashCache",
+                          help="local hash cache file, \"none\" for no cache [default: parent dir]")
+        parser.add_option(      "--include", dest="includes", action="append",
+                          help="only check local files matching gitignore style glob, may be repeated [default: all]")
+        parser.add_option(      "--no-ignore", dest="noIgnore", action="store_true", default=False,
+                          help="check files ignored by .gitignore and .git/info/exclude [default: %default]")
+        parser.add_option(      "--workers", dest="workers", type="int",
+                          help="hashing processes [default: cpu count]")
+        parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                          help="repositories scanned at once with --manifest [default: %default]")
         parser.add_option("-l", "--local", dest="localFiles", help="get local files [default: <here>/../../<repo>/src")
+        parser.add_option("-m", "--manifest", dest="manifest",
+                          help="scan the repositories listed in file: repo [branch [local dir]] per line [default: None]")
         parser.add_option("-n", "--new", dest="newfile", help="new files list file [default: parent dir]")
-        parser.add_option("-o", "--out", dest="outfile", help="get output file [default: None", metavar="FILE")
+        parser.add_option(      "--offline", dest="offline",
+                          help="compare local files with tree manifest file, no GitHub access or commit [default: None]")
+        parser.add_option("-o", "--out", dest="outfile",
+                          help="report file for scan results: remote files, dates, local changes, commits [default: console]",
+                          metavar="FILE")
+        parser.add_option(      "--pathqueries", dest="pathQueries", type="int",
+                          help="date up to this many files by their own history rather than scanning all history [default: %default]")
+        parser.add_option(      "--maxinflight", dest="maxInFlight", type="int",
+                          help="maximum concurrent API requests [default: %default]")
+        parser.add_option(      "--retries", dest="retries", type="int",
+                          help="retries of rate limited or failed API requests [default: %default]")
+        parser.add_option(      "--pull", dest="pull", action="store_true", default=False,
+                          help="download repository files missing or different locally, instead of committing [default: %default]")
+        parser.add_option(      "--profile", dest="profile",
+                          help="profile each phase with cprofile or pyinstrument [default: None]")
+        parser.add_option(      "--profiledir", dest="profileDir",
+                          help="directory for --profile output, a file per phase [default: %default]")
         parser.add_option("-p", "--pass", dest="password", help="get user password[default: None], metavar='PASSWORD'")
-        parser.add_option("-r", "--repo", dest="repo", help="get repository[default: %default], metavar='REPOSITORY'")
+        parser.add_option("-r", "--repo", dest="repo", help="get repository, name or owner/name[default: ExtendedModeler, with --offline the manifest's], metavar='REPOSITORY'")
+        parser.add_option(      "--report", dest="report", help="--manifest summary JSON file [default: None]")
+        parser.add_option(      "--savetree", dest="saveTree",
+                          help="save repository files to tree manifest file, for --offline [default: None]")
+        parser.add_option(      "--stats-json", dest="statsJson",
+                          help="write run statistics (phase times, requests, caches, rate limit) to JSON file [default: None]")
         parser.add_option("-t", "--token", dest="token", help="get login token[default: None], metavar='TOKEN'")
+        parser.add_option(      "--uploadmem", dest="uploadMem", type="int",
+                          help="memory limit for file uploads and downloads, MB [default: %default]")
         parser.add_option("-u", "--user", dest="user", help="get user name[default: None], metavar='USER'")
+        parser.add_option(      "--watch", dest="watch", action="store_true", default=False,
+                          help="after the scan keep the new files list current as local files change, no commit [default: %default]")
+        parser.add_option(      "--watchpoll", dest="watchPoll", type="float",
+                          help="--watch by polling every this many seconds, 0 - inotify if available [default: %default]")
         parser.add_option("-v", "--verbose", dest="verbose", action="count", help="set verbosity level [default: %default]")
 
         # set defaults
         parser.set_defaults(all=None, commLast=5, fullScan=None,
-                            branch="master",
+                            branch=None,
                             localFiles=os.path.join("c:\\Users\\raysm\\workspace\\"),
-                            outfile=None, password=None, repo="ExtendedModeler",
-                            token=None, user=None, verbose=0)
+                            outfile=None, password=None, repo=None,
+                            token=None, user=None, verbose=0, hashCache=None, workers=None,
+                            cacheFile=None, cacheSize=200, pathQueries=20, fetchers=8,
+                            baseUrl="https://api.github.com", maxInFlight=10, retries=6,
+                            uploadMem=64, batchFiles=1000, batchMb=100, manifest=None, jobs=4,
+                            report=None, saveTree=None, offline=None, excludes=None, includes=None,
+                            watchPoll=0, downloads=8, statsJson=None, profile=None,
+                            profileDir="profiles", descJson=None, scanReport=None, outFormat="text")
 
         # process options
         (opts, args) = parser.parse_args(argv)
 
         if opts.verbose > 0:
             print("verbosity level = %d" % opts.verbose)
+        stats_json = opts.statsJson
+        if opts.descJson:
+            obj_desc.jsonOut = open(opts.descJson, "w")
+        if opts.profile:
+            runStats.setProfiler(opts.profile, opts.profileDir)
         if not opts.newfile:
             opts.newfile = "new"
             if "." not in opts.newfile:
                 opts.newfile += ".commits"
             if not os.path.isabs(opts.newfile):
                 opts.newfile = os.path.join("..", opts.newfile)
+        if not opts.hashCache:
+            opts.hashCache = os.path.join("..", "hash.cache")
+        if not opts.cacheFile:
+            opts.cacheFile = os.path.join("..", "github_files.cache")
            
         if opts.outfile:
             if "." not in opts.outfile:
-                opts.outfile += ".out"
+                opts.outfile += {"text" : ".out", "jsonl" : ".jsonl", "csv" : ".csv"}[opts.outFormat]
             if not os.path.isabs(opts.outfile):
                 opts.outfile = os.path.join("..", opts.outfile)
-            out_file = os.path.abspath(opts.outfile)
-            print("outfile = %s" % out_file)
-            log = open(opts.outfile, "w")
-            stdout_saved = sys.stdout
-            sys.stdout = log
+            print("outfile = %s" % os.path.abspath(opts.outfile))
+        elif opts.outFormat != "text":
+            parser.error("--format %s needs --out" % opts.outFormat)
+        reporter.open(opts.outfile, opts.outFormat, verbose=opts.verbose)
 
         # MAIN BODY #
+        if opts.offline:
+            offline_diff(opts.offline, opts.localFiles, opts.repo, opts, opts.newfile)
+            print("Done")
+            return 0
+        if opts.repo is None:
+            opts.repo = "ExtendedModeler"
+            
         gH = None
         """
         User is determined by user + password, if provided,
         else by token, if provided
         else by token in TOKENFILE.txt
         """
+        from github import Github
         tokenfile = "TOKENFILE.txt";
         tokenfile = os.path.join("..", tokenfile)
+        github_args = dict(base_url=opts.baseUrl, per_page=100,
+                           pool_size=opts.maxInFlight)        # A pooled connection per request in flight
         if (opts.token):
-            gH = Github(login_or_token=opts.token)
+            gH = Github(login_or_token=opts.token, **github_args)
         elif (opts.user):
             if not opts.password:
                 opts.password = getpass()                
-            gH = Github(opts.user, opts.password)
+            gH = Github(opts.user, opts.password, **github_args)
         elif os.path.exists(tokenfile): 
             ftok = open(tokenfile, "r")
             filetoken = ftok.read()
-            gH = Github(login_or_token=filetoken)
+            gH = Github(login_or_token=filetoken, **github_args)
         else:
             user = input("Username:")
             password = getpass()
-            gH = Github(user, password)
+            gH = Github(user, password, **github_args)
         
         if (not gH):
             raise Exception("Can't get GitHub")  
+        scheduler = RequestScheduler(maxInFlight=opts.maxInFlight, maxRetries=opts.retries,
+                                     stats=runStats, verbose=opts.verbose)
+        scheduler.attach(githubRequester(gH))
         
-        user = gH.get_user()
+        if opts.manifest:
+            entries = read_manifest(opts.manifest, opts.branch, opts.localFiles)
+            sync_manifest(gH, entries, opts)
+            scheduler.report()
+            print("Done")
+            return 0
         
         if (not opts.repo):
             raise Exception("No repository specified")
+        if opts.branch is None:
+            opts.branch = "master"
         
-        print("repository: %s" % opts.repo)
-        repo = user.get_repo(opts.repo)
-        print("Got repo[%s]" % repo.full_name)
-        branches = repo.get_branches()
-        branch_names = []
-        for branch in branches:
-            branch_names.append(branch.name)
-        branches_str = ", ".join(branch_names)
-        print("branches: %s" % (branches_str))
-        branch_name = opts.branch
-        if not branch_name in branch_names:
-            print("branch name: %s is not in your branches: %s" % (branch_name, branches_str))
-            sys.exit(1)
-            
-        default_branch = repo.default_branch
-        print("default branch: %s" % default_branch)
-        if branch_name is None:
-            branch_name = default_branch
-        print("Using branch: %s" % branch_name)
-        branch = repo.get_branch(branch_name)
-        branch_commit = branch.commit
+        local_file_dir = local_dir(opts.localFiles, opts.repo)
+        if opts.pull:
+            opts.hashCompare = True                     # Content, not dates, decides
+            pull_repo(gH, opts.repo, opts.branch, local_file_dir, opts, nDownloader=opts.downloads,
+                      memBudget=opts.uploadMem*1024*1024)
+            scheduler.report()
+            print("Pull Done")
+            return 0
             
-        local_files_spec = os.path.join(opts.localFiles, opts.repo)
-        local_file_dir = os.path.abspath(local_files_spec)
-        lsrc = os.path.join(local_file_dir, "src")
-        if os.path.exists(lsrc) and os.path.isdir(lsrc):
-            local_file_dir = lsrc
-            print("Using \"src\" sub directory for files")
-        print("Local files: %s" % local_file_dir)
-        
         if (opts.commit):
-            commit_files(repo, local_file_dir, opts.newfile, branch=opts.branch)        # Just commit from new file list
+            repo = get_repository(gH, opts.repo)
+            reporter.scan(repo.full_name, opts.branch)
+            print("Local files: %s" % local_file_dir)
+            commit_files(repo, local_file_dir, opts.newfile, branch=opts.branch,        # Just commit from new file list
+                         memBudget=opts.uploadMem*1024*1024, maxBatchEntries=opts.batchFiles,
+                         maxBatchBytes=opts.batchMb*1024*1024)
+            scheduler.report()
             print("Commit Done")
             exit(0)
             
-        if opts.fullScan:
-            detailed_scan()
-        cF = CommittedFiles(repo, verbose=opts.verbose)
-        cF.collectDir()
-        cF.collectCommitDates()
-        print("%d files of %d have commit dates" % (cF.nDated, cF.nFile))
-        """
-        Scanning local files, checking for updates
-        """
-        changed_files = []
-        for foldername, subfolders, filenames in os.walk(local_file_dir):
-            print("Checking files in %s..." % (foldername))
-            ldir = foldername[len(local_file_dir)+1:]
-            # Add all the files in this folder
-            for filename in filenames:
-                lfilepath = os.path.join(foldername, filename)
-                lpath = os.path.join(local_file_dir, ldir, filename)
-                if not os.path.exists(lpath):
-                    print("Can't find path %s - ignored" % lpath)
-                    continue
-
-                rpath = lpath[len(local_file_dir)+1:].replace("\\", "/", 99)
-                if opts.verbose > 0:
-                    print("%s" % rpath)
-                fentry = cF.fileEntry(key=rpath)
-                if (not fentry):
-                    print("%s not in repository ==> New" % rpath)
-                    changed_files.append(lpath)     # Add to list
-                    continue
-
-                repo_date = fentry.date
-                repo_date_str = repoDateToLocalStr(repo_date)
-                repo_time = repoDateToLocalTime(repo_date)
-                ltime = os.path.getmtime(lpath)
-                ltime_str = datetime.datetime.fromtimestamp(ltime)
-                if opts.verbose > 0:
-                    print("%s %s repo: '%s'" % (rpath, ltime_str, repo_date_str))
-                #lfile = datetime.datetime.strptime(linx_file_dtime[:-3], '%Y-%m-%d_%H:%M:%S.%f')
-                if ltime > repo_time:
-                    print("%s local is newer %s than repo %s" % (rpath, ltime_str, repo_date_str))
-                    changed_files.append(lpath)     # Add to list
-        if len(changed_files) > 0:
-            commit_list_file = os.path.abspath(opts.newfile)
-            print("Changed file list is in %s" % commit_list_file)
-            fout = open(commit_list_file, 'w')
-            out_str = "\n".join(changed_files)
-            fout.write(out_str)
-            fout.close()
-            
-            commit_files(repo, local_file_dir, opts.newfile, branch=opts.branch)        # Just commit from new file list
+        summary = scan_repo(gH, opts.repo, opts.branch, local_file_dir, opts, opts.newfile, opts.saveTree)
+        if summary["error"] is not None:
+            sys.exit(1)
+        if opts.watch:
+            watch_changes(summary["committedFiles"], local_file_dir, summary["changedFiles"], opts, opts.newfile)
+        elif summary["changed"] > 0:
+            commit_files(summary["repository"], local_file_dir, opts.newfile, branch=summary["branch"],        # Just commit from new file list
+                         memBudget=opts.uploadMem*1024*1024, maxBatchEntries=opts.batchFiles,
+                         maxBatchBytes=opts.batchMb*1024*1024)
         else:
             print("No new or changed files")
             
+        scheduler.report()
         print("Done")
-        if opts.outfile:
-            sys.stdout = stdout_saved
-            print("Output is in %s" % out_file)
         
             
     except Exception as e:
         indent = len(program_name) * " "
         sys.stderr.write(program_name + ": " + repr(e) + "\n")
-        traceback.print_stack(e)
+        traceback.print_exc()
         sys.stderr.write(indent + "  for help use --help")
         return 2
+    
+    finally:
+        reporter.close()
+        if obj_desc.jsonOut is not None:
+            obj_desc.jsonOut.close()
+            obj_desc.jsonOut = None
+        if stats_json:
+            runStats.writeJson(stats_json)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# encoding: utf-8
+'''
+github_files_bench -- Benchmarks for github_files
+
+Measures, on synthetic data, the costs github_files works to keep down.
+Needs no GitHub access: the API benchmarks run against fake_github,
+a local server with synthetic repositories and configurable latency,
+and compare the serial way of doing each step with the current one.
+
+    python github_files_bench.py memory -n 1000000
+    python github_files_bench.py list dates scan commit -n 2000 --commits 200 --latency .05
+    python github_files_bench.py startup --runs 10
+    python github_files_bench.py report -n 200000
+'''
+
+import sys
+import os
+import time
+import json
+import shutil
+import random
+import datetime
+import tempfile
+import subprocess
+import tracemalloc
+from optparse import OptionParser, Values
+
+from github import Github
+import github_files as gf
+import fake_github
+
+
+"""
+Synthetic tree listing: nFile paths spread over a directory tree
+of the given depth, like get_git_tree's recursive listing
+"""
+def synthetic_entries(nFile, depth=4, fanOut=20, seed=1):
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(nFile):
+        dirs = ["d%d_%d" % (level, rnd.randrange(fanOut)) for level in range(rnd.randint(0, depth))]
+        path = "/".join(dirs + ["file%d.py" % i])
+        sha = "%040x" % rnd.getrandbits(160)
+        entries.append(gf.FileEntry(path, "file", rnd.randrange(100000), sha))
+    return entries
+
+
+"""
+The CommittedFile layout before it was made compact, for comparison
+"""
+class DictCommittedFile:
+    def __init__(self, dir_content_file):
+        self.fileName = dir_content_file.name
+        self.fileType = dir_content_file.type
+        self.fileSize = dir_content_file.size
+        self.filePath = dir_content_file.path
+        self.fileSha = dir_content_file.sha
+        self.key = self.filePath
+        self.date = None
+
+
+"""
+Memory per entry of CommittedFiles.fileDict, counting what stays
+alive once the tree listing is dropped: records, their strings
+and the dict itself
+"""
+def bench_memory(nFile, verbose=0):
+    print("memory: %d files" % nFile)
+    results = {}
+    for name, record in (("dict", DictCommittedFile), ("compact", gf.CommittedFile)):
+        tracemalloc.start()
+        entries = synthetic_entries(nFile)
+        start_time = time.time()
+        file_dict = {}
+        for entry in entries:
+            file = record(entry)
+            file_dict[file.filePath] = file
+        elapsed = time.time() - start_time
+        del entries, entry
+        used, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = used
+        print("    %-8s %7.1f bytes/entry %8.1f MB %6.2f sec" % (name, used/nFile, used/1e6, elapsed))
+        del file_dict, file
+    print("    compact uses %.0f%% of dict" % (100.*results["compact"]/results["dict"]))
+    return results
+
+
+"""
+Lookup by path and by directory prefix, of files and of commit dates
+"""
+def bench_lookup(nFile, verbose=0):
+    print("lookup: %d files" % nFile)
+    cF = gf.CommittedFiles(None)
+    entries = synthetic_entries(nFile)
+    for entry in entries:
+        cF.addFile(entry)
+    start_time = time.time()
+    for entry in entries:
+        cF.fileEntry(key=entry.path)
+    elapsed = time.time() - start_time
+    print("    path   %8.0f lookups/s" % (nFile/elapsed))
+
+    prefixes = sorted(set(entry.path.rsplit("/", 1)[0] for entry in entries if "/" in entry.path))
+    start_time = time.time()
+    nfound = 0
+    for prefix in prefixes:
+        for file in cF.filesUnder(prefix):
+            nfound += 1
+    elapsed = time.time() - start_time
+    print("    prefix %8.0f lookups/s, %d directories %d files" % (len(prefixes)/elapsed, len(prefixes), nfound))
+
+    index = gf.CommitDateIndex()
+    date = datetime.datetime(2018, 3, 1)
+    for entry in entries:
+        index.setDate(entry.path, date, entry.sha)
+    start_time = time.time()
+    for entry in entries:
+        index.date(entry.path)
+    elapsed = time.time() - start_time
+    print("    date   %8.0f lookups/s" % (nFile/elapsed))
+    start_time = time.time()
+    for prefix in prefixes:
+        index.lastModified(prefix)
+    elapsed = time.time() - start_time
+    print("    newest %8.0f lookups/s, newest date below a directory" % (len(prefixes)/elapsed))
+
+
+"""
+Fake GitHub serving a synthetic repository, and a Github session for it
+with the request scheduler attached, as main sets up
+"""
+class FakeSession:
+    def __init__(self, opts, maxInFlight=10):
+        self.fakeRepo = fake_github.makeRepo(nFile=opts.nFile, nCommit=opts.nCommit, nDir=opts.nDir,
+                                             fileSize=opts.fileSize)
+        self.server = fake_github.FakeGitHub([self.fakeRepo], latency=opts.latency,
+                                             rateLimit=1000000)
+        self.server.start()
+        self.gH = Github(login_or_token="bench", base_url=self.server.baseUrl, per_page=100)
+        self.scheduler = gf.RequestScheduler(maxInFlight=maxInFlight, verbose=0)
+        self.scheduler.attach(gf.githubRequester(self.gH))
+        self.repo = self.gH.get_user().get_repo(self.fakeRepo.name)
+
+    """
+    Write the branch head's files below local_dir
+    """
+    def materialize(self, local_dir):
+        fake_repo = self.fakeRepo
+        head = fake_repo.refs[fake_repo.default_branch]
+        for path, (mode, type, sha) in fake_repo.flatTree(fake_repo.commits[head]["tree"]).items():
+            file_path = os.path.join(local_dir, *path.split("/"))
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as fout:
+                fout.write(fake_repo.blobs[sha])
+
+    def close(self):
+        self.server.stop()
+
+
+"""
+Run variant (name, function(session)) in a fresh session each,
+printing and returning seconds and requests
+"""
+def compare(title, variants, opts, maxInFlight=10):
+    print("%s: %d files, %d commits, %.0f ms latency" % (title, opts.nFile, opts.nCommit, opts.latency*1000))
+    results = {}
+    for name, function in variants:
+        session = FakeSession(opts, maxInFlight=maxInFlight)
+        try:
+            saved_stdout = sys.stdout
+            sys.stdout = open(os.devnull, "w")      # No progress output
+            try:
+                start_time = time.time()
+                function(session)
+                elapsed = time.time() - start_time
+            finally:
+                sys.stdout.close()
+                sys.stdout = saved_stdout
+            results[name] = dict(seconds=elapsed, requests=session.server.nRequest)
+            print("    %-8s %7.2f sec %6d requests" % (name, elapsed, session.server.nRequest))
+        finally:
+            session.close()
+    names = [name for name, function in variants]
+    if len(names) == 2 and results[names[1]]["seconds"] > 0:
+        print("    %s is %.1fx faster" % (names[1], results[names[0]]["seconds"]/results[names[1]]["seconds"]))
+    return results
+
+
+"""
+File listing: a contents request per directory (collectDir)
+against recursive tree requests (collectTree)
+"""
+def bench_list(opts):
+    def serial(session):
+        gf.CommittedFiles(session.repo, verbose=0).collectDir("")
+    def tree(session):
+        gf.CommittedFiles(session.repo, verbose=0).collectTree()
+    return compare("list", [("serial", serial), ("tree", tree)], opts)
+
+
+"""
+Commit date resolution: one commit detail request at a time
+against opts.fetchers concurrent ones
+"""
+def bench_dates(opts):
+    def dates(nFetcher):
+        def run(session):
+            cF = gf.CommittedFiles(session.repo, verbose=0, nFetcher=nFetcher)
+            cF.collectTree()
+            cF.collectCommitDates(maxUndated=0)
+        return run
+    return compare("dates", [("serial", dates(1)), ("fetchers", dates(opts.fetchers))], opts)
+
+
+"""
+End to end scan: listing, dates and the local comparison,
+serial as it was against as main now does it
+"""
+def bench_scan(opts):
+    scan_opts = Values(dict(hashCompare=False, verbose=0, excludes=None, includes=None,
+                                noIgnore=False, hashCache="none", workers=None))
+    def scan(serial):
+        def run(session):
+            local_dir = tempfile.mkdtemp(prefix="bench_")
+            try:
+                session.materialize(local_dir)
+                cF = gf.CommittedFiles(session.repo, verbose=0, nFetcher=1 if serial else opts.fetchers)
+                if serial:
+                    cF.collectDir("")
+                else:
+                    cF.collectTree()
+                cF.collectCommitDates(maxUndated=0)
+                gf.changed_local_files(cF, local_dir, scan_opts)
+            finally:
+                shutil.rmtree(local_dir)
+        return run
+    return compare("scan", [("serial", scan(True)), ("current", scan(False))], opts)
+
+
+"""
+Commit throughput: opts.changed files changed locally, uploaded
+one at a time against concurrently, then committed
+"""
+def bench_commit(opts):
+    def commit(nUploader):
+        def run(session):
+            local_dir = tempfile.mkdtemp(prefix="bench_")
+            try:
+                session.materialize(local_dir)
+                local_files = []
+                for dir_path, dir_names, file_names in os.walk(local_dir):
+                    for file_name in sorted(file_names):
+                        local_files.append(os.path.join(dir_path, file_name))
+                local_files = sorted(local_files)[:opts.changed]
+                for local_file in local_files:
+                    with open(local_file, "ab") as fout:
+                        fout.write(b"changed\n")
+                gf.commit_list(session.repo, local_dir, local_files, branchName="master",
+                               commit_message="bench", nUploader=nUploader)
+            finally:
+                shutil.rmtree(local_dir)
+        return run
+    return compare("commit %d files" % opts.changed,
+                   [("serial", commit(1)), ("uploaders", commit(opts.fetchers))], opts)
+
+
+"""
+Seconds from process start to the first line of output, and to exit,
+of github_files commands needing no GitHub access, median of opts.runs.
+Run as is (lazy) and with PyGithub imported first (eager), as every
+command used to.
+"""
+def bench_startup(opts):
+    print("startup: %d runs, %d file manifest" % (opts.runs, opts.nFile))
+    script = os.path.abspath(gf.__file__)
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        cF = gf.CommittedFiles(None)
+        for entry in synthetic_entries(opts.nFile):
+            cF.addFile(entry)
+        manifest_file = os.path.join(work_dir, "bench.tree")
+        saved_stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            cF.saveManifest(manifest_file, "bench/Bench")
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved_stdout
+        os.makedirs(os.path.join(work_dir, "Bench"))
+        commands = [("help", ["--help"]),
+                    ("offline", ["--offline", manifest_file, "-l", work_dir, "-r", "Bench", "--hash", "--hashcache", "none",
+                                 "-n", os.path.join(work_dir, "new.commits")])]
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        results = {}
+        for variant, preamble in (("eager", "import github; "), ("lazy", "")):
+            for name, args in commands:
+                first_times = []
+                exit_times = []
+                for run in range(opts.runs):
+                    code = "%simport sys, runpy; sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__')" % preamble
+                    start_time = time.time()
+                    process = subprocess.Popen([sys.executable, "-c", code, script] + args,
+                                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env)
+                    process.stdout.readline()
+                    first_times.append(time.time() - start_time)
+                    process.communicate()
+                    exit_times.append(time.time() - start_time)
+                first_output = sorted(first_times)[len(first_times)//2]
+                seconds = sorted(exit_times)[len(exit_times)//2]
+                results["%s %s" % (variant, name)] = dict(firstOutput=first_output, seconds=seconds)
+                print("    %-6s %-8s first output %6.3f sec  exit %6.3f sec" % (variant, name, first_output, seconds))
+    finally:
+        shutil.rmtree(work_dir)
+    return results
+
+
+"""
+Local comparison output, an item per file as with -v: print with
+sys.stdout redirected to a file, as --out used to, against the
+buffered report in each format, and the cost of items filtered out
+"""
+def bench_report(opts):
+    print("report: %d items" % opts.nFile)
+    local_time = time.time()
+    repo_time = local_time - 86400
+    paths = ["dir%d/file%d.py" % (i % 100, i) for i in range(opts.nFile)]
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    results = {}
+    try:
+        out_file = os.path.join(work_dir, "report")
+        saved_stdout = sys.stdout
+        sys.stdout = open(out_file, "w")
+        try:
+            start_time = time.time()
+            for path in paths:
+                print("%s %s repo: '%s'" % (path, datetime.datetime.fromtimestamp(local_time),
+                                            gf.repoDateToLocalStr(datetime.datetime.utcfromtimestamp(repo_time))))
+            elapsed = time.time() - start_time
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved_stdout
+        results["print"] = elapsed
+        
+        for format in gf.Reporter.FORMATS:
+            reporter = gf.Reporter()
+            reporter.open(out_file, format, verbose=1)
+            saved_stdout = sys.stdout
+            sys.stdout = open(os.devnull, "w")
+            try:
+                start_time = time.time()
+                for path in paths:
+                    reporter.item(1, "compare", path=path, localTime=local_time, repoTime=repo_time)
+                reporter.close()
+                elapsed = time.time() - start_time
+            finally:
+                sys.stdout.close()
+                sys.stdout = saved_stdout
+            results[format] = elapsed
+        
+        reporter = gf.Reporter(verbose=0)
+        start_time = time.time()
+        for path in paths:
+            reporter.item(1, "compare", path=path, localTime=local_time, repoTime=repo_time)
+        results["filtered"] = time.time() - start_time
+    finally:
+        shutil.rmtree(work_dir)
+    for name, elapsed in results.items():
+        print("    %-8s %7.3f sec %9.0f items/s" % (name, elapsed, opts.nFile/max(elapsed, 1e-9)))
+    return results
+
+
+benchmarks = {"memory" : lambda opts: bench_memory(opts.nFile, verbose=opts.verbose),
+              "lookup" : lambda opts: bench_lookup(opts.nFile, verbose=opts.verbose),
+              "list" : bench_list,
+              "dates" : bench_dates,
+              "scan" : bench_scan,
+              "commit" : bench_commit,
+              "startup" : bench_startup,
+              "report" : bench_report}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = OptionParser(usage="%prog [options] [benchmark ...]  benchmarks: " + ", ".join(benchmarks))
+    parser.add_option("-n", "--nfile", dest="nFile", type="int", help="files in synthetic tree [default: %default]")
+    parser.add_option(      "--commits", dest="nCommit", type="int", help="commits of history [default: %default]")
+    parser.add_option(      "--dirs", dest="nDir", type="int", help="directories [default: %default]")
+    parser.add_option(      "--filesize", dest="fileSize", type="int", help="bytes per file [default: %default]")
+    parser.add_option(      "--latency", dest="latency", type="float", help="fake server seconds per request [default: %default]")
+    parser.add_option(      "--fetchers", dest="fetchers", type="int", help="concurrent requests of current implementation [default: %default]")
+    parser.add_option(      "--changed", dest="changed", type="int", help="files changed for commit benchmark [default: %default]")
+    parser.add_option(      "--runs", dest="runs", type="int", help="runs of each command for startup benchmark [default: %default]")
+    parser.add_option(      "--json", dest="jsonFile", help="also write results to JSON file [default: None]")
+    parser.add_option("-v", "--verbose", dest="verbose", action="count", help="set verbosity level [default: %default]")
+    parser.set_defaults(nFile=None, nCommit=100, nDir=20, fileSize=1000, latency=.02, fetchers=8,
+                        changed=50, runs=5, jsonFile=None, verbose=0)
+    (opts, args) = parser.parse_args(argv)
+    names = args if args else list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark %s" % name)
+    results = {}
+    for name in names:
+        if opts.nFile is None:
+            nfile = 100000 if name in ("memory", "lookup", "report") else 500
+            results[name] = benchmarks[name](optparse_copy(opts, nFile=nfile))
+        else:
+            results[name] = benchmarks[name](opts)
+    if opts.jsonFile:
+        with open(opts.jsonFile, "w") as fout:
+            json.dump(dict(options=vars(opts), results=results), fout, indent=2)
+        print("Results are in %s" % os.path.abspath(opts.jsonFile))
+    return 0
+
+
+"""
+Copy of optparse Values with some settings changed
+"""
+def optparse_copy(opts, **settings):
+    values = dict(vars(opts))
+    values.update(settings)
+    return Values(values)
+
+
+if __name__ == "__main__":
+    sys.exit(main())